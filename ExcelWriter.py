@@ -1,21 +1,84 @@
+import csv
+import os
 import traceback
 
-import pandas as pd
+# next to this file, so that reports are written from any working directory (e.g. under cron)
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inactive_template.xlsx")
+# template column -> value for UserInfo; columns of the template missing here are left empty
+COLUMNS = {
+    'ID': lambda user: user.id,
+    'Имя': lambda user: user.first_name,
+    'Фамилия': lambda user: user.last_name,
+    'Ссылка': lambda user: f'https://vk.com/{user.screen_name}',
+}
+GROUPS_COLUMN = 'Группы'  # added to the cross-group report
 
 
-def dump_users(vk):
+def read_template(path: str = TEMPLATE):
+    """Returns column names and column widths of the template"""
+    import openpyxl  # imported on the first report, not at startup
+    sheet = openpyxl.load_workbook(path).active
+    columns = [cell.value for cell in sheet[1] if cell.value]
+    widths = {letter: dim.width for letter, dim in sheet.column_dimensions.items() if dim.width}
+    return columns, widths
+
+
+def make_rows(users, columns: list, extra: dict = None):
+    """Generator of report rows in the order of *columns*. *extra*: column -> value for UserInfo, besides COLUMNS"""
+    getters = {**COLUMNS, **(extra or {})}
+    getters = [getters.get(column, lambda user: None) for column in columns]
+    for user in users:
+        yield [getter(user) for getter in getters]
+
+
+def write_xlsx(path: str, columns: list, rows, widths: dict = None):
+    """Writes rows one by one with write-only workbook, nothing is kept in memory"""
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for letter, width in (widths or {}).items():
+        sheet.column_dimensions[letter].width = width
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def write_csv(path: str, columns: list, rows, widths: dict = None):
+    with open(file=path, mode='w', newline='', encoding='utf-8-sig') as file:  # BOM so that Excel detects UTF-8
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def write_parquet(path: str, columns: list, rows, widths: dict = None):
+    import pandas as pd  # only needed for this format
+    pd.DataFrame(list(rows), columns=columns).to_parquet(path, index=False)
+
+
+WRITERS = {'xlsx': write_xlsx, 'csv': write_csv, 'parquet': write_parquet}
+
+
+def dump_users(vk, fmt: str = 'xlsx', path: str = None, groups: dict = None):
+    """
+    :param vk: VkUserBot with inactive users found
+    :param fmt: one of 'xlsx', 'csv', 'parquet'
+    :param path: output file, inactive.<fmt> by default
+    :param groups: user id -> names of the groups the user is inactive in, written into an extra column
+    :return: path of the report, None if it could not be written
+
+    Writes report about inactive users in columns of the template
+    """
     try:
-        df = pd.read_excel("inactive_template.xlsx")
-        data = vk.collect_users_info()
-        for user in data:
-            add = pd.DataFrame(
-                {
-                    'Имя': [user.first_name],
-                    'Фамилия': [user.last_name],
-                    'Ссылка': [f'https://vk.com/{user.screen_name}'],
-                })
-            df = pd.concat([df, add], ignore_index=True, axis=0)
-        df.to_excel("inactive.xlsx", index=False)
+        columns, widths = read_template()
+        extra = None
+        if groups is not None:
+            columns = columns + [GROUPS_COLUMN]
+            extra = {GROUPS_COLUMN: lambda user: ', '.join(groups.get(user.id, ()))}
+        rows = make_rows(vk.collect_users_info(), columns, extra)
+        path = path or f"inactive.{fmt}"
+        WRITERS[fmt](path, columns, rows, widths)
+        return path
     except Exception as ex:
         print(ex)
         traceback.print_exc()
@@ -11,67 +11,139 @@ furnished to do so, subject to the following conditions:
 The above copyright notice and this permission notice shall be included in all
 copies or substantial portions of the Software.
 """
+import copy
 import time
-
-import PySimpleGUI
-
-from rls import RateLimitingSemaphore
+from datetime import datetime
+from array import array
+from collections import namedtuple
+from itertools import islice
+
+from batcher import ExecuteBatcher
+from cache import ActivityCache, ProfileCache
+from config import get_config, reload_config
+from crawler import CommentCrawler
+from idset import IdSet, MemberActivity
+from journal import DeletionJournal
+from metrics import Metrics
+import planner
+from progress import OperationCancelled, Progress
+from rls import TokenDropped, TokenPool, TokenSlot, PRIORITY_BULK, PRIORITY_INTERACTIVE, TOKEN_ERROR_CODES
+from transport import PooledHttpClient
 from vkbottle import API
 from vkbottle import VKAPIError
 import asyncio
 from ExcelWriter import dump_users
 
+INTERACTIVE_METHODS = frozenset({'groups.getById'})  # lookups that should not wait behind bulk scans
+UserInfo = namedtuple('UserInfo', ['id', 'first_name', 'last_name', 'screen_name'])
+TOKEN_ERRORS = tuple(VKAPIError[code] for code in TOKEN_ERROR_CODES)
+
 
-def read_token():
-    try:
-        with open(file="token.txt", mode='r') as file:
-            return file.read()
-    except FileNotFoundError:
-        return None
+def post_timestamp(post) -> float:
+    """Date of *post* as Unix time: depending on the version, vkbottle models give it as int or as datetime"""
+    return post.date.timestamp() if isinstance(post.date, datetime) else post.date
 
 
 class MyAPI(API):
-    """Own API class implementation with request method overloaded to limit RPS"""
-    def __init__(self, token:  str, limit: int = 3):
-        super().__init__(token)
-        self.sema = RateLimitingSemaphore(limit)
-        self.requests = 0
+    """Own API class implementation with request method overloaded to limit RPS and batch calls via execute.
+    Several tokens can be given, each of them gets its own RPS limit. Pass the same *http_client* to
+    every instance of a session to keep reusing its connections"""
+    def __init__(self, token, limit: int = 3, batch: bool = True, api_url: str = None, retries: int = 5,
+                 http_client: PooledHttpClient = None):
+        tokens = [token] if isinstance(token, str) or token is None else list(token)
+        super().__init__(tokens[0] if tokens else None, http_client=http_client or PooledHttpClient())
+        if api_url:  # e.g. local fake VK endpoint
+            self.API_URL = api_url
+        self.metrics = Metrics()
+        self.pool = TokenPool([t for t in tokens if t], limit, self.metrics)
+        self.retries = retries  # attempts to repeat a request failed with error 6 or with a dropped token
+        self.batcher = ExecuteBatcher(self) if batch else None
+        self.requests = 0  # HTTP requests sent
+        self.calls = 0  # API methods completed, including the ones packed into execute
 
     async def request(self, method: str, data: dict) -> dict:
-        """Makes a single request opening a session (overload)"""
-        async with self.sema:
-            data = await self.validate_request(data)
-
-            async with self.token_generator as token:
-                response = await self.http_client.request_text(
-                    self.API_URL + method,
-                    method="POST",
-                    data=data,  # type: ignore
-                    params={"access_token": token, "v": self.API_VERSION},
-                    )
-            self.requests += 1
-            return await self.validate_response(method, data, response)  # type: ignore
+        """Makes a single request or queues it into an execute batch (overload).
+        Requests failed with error 6 or because of a bad token are repeated"""
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.send(method, data)
+                break
+            except (VKAPIError[6], TokenDropped):
+                if attempt == self.retries:
+                    raise
+        self.calls += 1
+        self.metrics.calls[method] += 1
+        return response
+
+    async def send(self, method: str, data: dict) -> dict:
+        if self.batcher and self.batcher.accepts(method):
+            return await self.batcher.submit(method, data)
+        priority = PRIORITY_INTERACTIVE if method in INTERACTIVE_METHODS else PRIORITY_BULK
+        slot = await self.pool.acquire(priority)
+        data = await self.validate_request(data)
+        return await self.post(method, data, slot)
+
+    async def post(self, method: str, data: dict, slot: TokenSlot) -> dict:
+        """Sends already validated request with the token of *slot*, acquired from self.pool by the caller"""
+        start = time.perf_counter()
+        response = await self.http_client.request_text(
+            self.API_URL + method,
+            method="POST",
+            data=data,  # type: ignore
+            params={"access_token": slot.token, "v": self.API_VERSION},
+            )
+        received = time.perf_counter()
+        self.requests += 1
+        self.metrics.requests[method] += 1
+        self.metrics.bytes_received += len(response)
+        self.metrics.observe('latency', received - start)
+        try:
+            response = await self.validate_response(method, data, response)  # type: ignore
+        except VKAPIError as ex:
+            self.metrics.errors[ex.code] += 1  # once per request, not once per call packed into it
+            if isinstance(ex, VKAPIError[6]):
+                slot.sema.slow_down()
+            elif isinstance(ex, TOKEN_ERRORS) and self.pool.drop(slot):
+                raise TokenDropped(f'{method}: token #{len(self.pool.dropped)} dropped from rotation')
+            raise
+        finally:
+            self.metrics.observe('validation', time.perf_counter() - received)
+        slot.sema.speed_up()
+        return response
+
+    def reset_stats(self):
+        self.requests = 0
+        self.calls = 0
+        self.metrics.reset()
 
     def set_sema(self, limit: int):
         """
-        :param limit: new max RPS
+        :param limit: new max RPS (per token)
         :return: None
 
         Sets new max RPS
         """
-        self.sema = RateLimitingSemaphore(limit)
+        self.pool.set_limit(limit)
 
 
 class VkUserBot:
-    def __init__(self, logger):
-        asyncio.set_event_loop(asyncio.new_event_loop())
+    def __init__(self, logger, cache: bool = True, connections: int = 100):
+        self.loop = asyncio.new_event_loop()  # every operation runs on it, so connections stay bound to one loop
+        asyncio.set_event_loop(self.loop)
         self.logger = logger
         self.group = None
         self.inactive = None
-        token = read_token()
-        self.api = MyAPI(token=token)
-        if token:
-            self.logger.log("vk_api initialized")
+        self.crawler = None
+        self.activity = None  # MemberActivity of the early-exit scan
+        self.journal = None
+        self.failed_reports = list()  # reports of the last search that could not be written
+        self.cache = ActivityCache() if cache else None
+        self.profiles = ProfileCache(db=self.cache.db) if cache else None
+        self.http = PooledHttpClient(limit=connections)  # shared by every MyAPI of this bot
+        tokens = get_config().tokens
+        self.api = MyAPI(token=tokens, http_client=self.http)
+        if tokens:
+            self.logger.log(f"vk_api initialized with {len(tokens)} token(s)")
         else:
             self.logger.log("no token for vk_api")
 
@@ -82,188 +154,577 @@ class VkUserBot:
         self.group = group
         pass
 
-    def find_inactive(self, amount: int, window: PySimpleGUI.Window, rps: int = 3) -> set:
+    def find_inactive(self, amount: int, progress: Progress = None, rps: int = 3, report: str = 'xlsx',
+                      days: int = None, early_exit: bool = False) -> IdSet:
         """
-        :param window:
-        :param amount: amount of posts to search through
+        :param amount: amount of posts to search through (max amount if *days* is given)
+        :param progress: subscriber to report progress to
         :param rps: RPS limit
+        :param report: format of the report (see ExcelWriter.dump_users), None to skip it
+        :param days: search only through posts of the last *days* days
+        :param early_exit: stop the scan once activity of subscribers is not found anymore (see resolve_inactive)
         :return: list of IDs of inactive people
         Create a list of people inactive on last *amount* posts"""
-        self.logger.log(f'Searching for inactive users with rps={rps}')
-        self.api.requests = 0
+        self.logger.log(f'Searching for inactive users with rps={rps}' + (', early exit' if early_exit else ''))
+        self.api.reset_stats()
         self.api.set_sema(limit=rps)
-        loop = asyncio.get_event_loop()
-        inactive = loop.run_until_complete(self.gather_inactive(window, amount))
+        search = self.resolve_inactive if early_exit else self.gather_inactive
+        inactive = self.run(search(progress or Progress(), amount, days))
         self.inactive = inactive
-        dump_users(self)
+        self.journal = None  # new search result needs a new deletion plan
+        self.failed_reports = list()
+        if report:
+            self.write_report(self, report)
+        self.log_metrics('search')
         return inactive
 
-    def find_group_sync(self, group_id):
+    def find_inactive_groups(self, group_ids: list, amount: int, progress: Progress = None, rps: int = 3,
+                             exclude_active: bool = False, report: str = 'xlsx', days: int = None) -> tuple:
+        """
+        :param group_ids: IDs or short names of the groups
+        :param amount: amount of posts to search through in every group (max amount if *days* is given)
+        :param progress: subscriber to report progress to
+        :param rps: RPS limit, shared by all the groups
+        :param exclude_active: do not count users active in any of the groups as inactive
+        :param report: format of the reports (one per group plus inactive_several.<report>), None to skip them
+        :param days: search only through posts of the last *days* days
+        :return: tuple of dict group id -> VkUserBot of that group with its inactive users found
+            and dict user id -> ids of the groups, for users inactive in several groups
+
+        Scans all the groups at the same time
+        """
+        self.logger.log(f'Searching for inactive users in {len(group_ids)} groups with rps={rps}')
+        self.api.reset_stats()
+        self.api.set_sema(limit=rps)
+        bots = self.run(self.gather_groups(progress or Progress(), group_ids, amount, exclude_active, days))
+        self.failed_reports = list()
+        seen, several = IdSet(), IdSet()
+        for gid, bot in bots.items():
+            self.logger.log(f'group {gid} ({bot.group.get("name")}): {len(bot.inactive)} inactive')
+            several.update(seen & bot.inactive)
+            seen.update(bot.inactive)
+            if report:
+                self.write_report(bot, report, f'inactive_{gid}.{report}')
+        cross = {uid: list() for uid in several}
+        for gid, bot in bots.items():
+            for uid in several & bot.inactive:
+                cross[uid].append(gid)
+        self.logger.log(f'{len(cross)} users are inactive in several groups')
+        if report and cross:
+            names = {gid: f'{bot.group.get("name")} ({gid})' for gid, bot in bots.items()}
+            combined = self.for_group()
+            combined.inactive = several
+            self.write_report(combined, report, f'inactive_several.{report}',
+                              groups={uid: [names[gid] for gid in gids] for uid, gids in cross.items()})
+        self.log_metrics('search')
+        return bots, cross
+
+    def write_report(self, bot, fmt: str, path: str = None, groups: dict = None):
+        """Writes report about inactive users of *bot* (see ExcelWriter.dump_users), remembers it if it failed"""
+        written = dump_users(bot, fmt, path, groups)
+        if written is None:
+            self.failed_reports.append(path or f'inactive.{fmt}')
+            self.logger.log(f'Report {self.failed_reports[-1]} could not be written')
+        return written
+
+    def dry_run(self, amount: int = None, rps: int = 3, days: int = None,
+                journal: DeletionJournal = None) -> planner.Plan:
+        """
+        :param amount: amount of posts to search through (max amount if *days* is given), None to plan deletion only
+        :param rps: RPS limit to plan for
+        :param days: search only through posts of the last *days* days
+        :param journal: plan the deletion of the users pending in this journal (see pending_journal())
+        :returns: estimate of requests and time of the search, the report and the deletion
+
+        Makes only cheap requests: amount of members and pages of the wall with counts of likes and comments.
+        The report and the deletion are planned for *journal* or self.inactive if a search was made, else for
+        all members. Neither self.group nor self.inactive are changed
+        """
+        self.api.reset_stats()
+        self.api.set_sema(limit=rps)
+        plan = self.run(self.make_plan(amount, rps, days, journal))
+        self.logger.log(f'dry run ({plan.requests} requests made):\n{plan.summary()}')
+        return plan
+
+    async def make_plan(self, amount: int, rps: int, days: int = None,
+                        journal: DeletionJournal = None) -> planner.Plan:
+        gid = journal.group_id if journal else self.group.get('id')
+        inactive = journal.pending if journal else self.inactive
+        members = (await self.api.groups.get_members(group_id=gid, count=1)).count
+        likes, comments, cached = list(), list(), 0
+        if amount or days:
+            async for posts in self.iter_posts_since(days, amount) if days else self.iter_posts(amount):
+                for post in posts:
+                    if self.cache and self.cache.get(gid, post, touch=False) is not None:
+                        cached += 1
+                        continue
+                    likes.append(post.likes.count if post.likes else 0)
+                    comments.append(post.comments.count if post.comments else 0)
+        plan = planner.Plan(rps, len(self.api.pool), self.api.batcher is not None, self.latency())
+        plan.requests = self.api.requests
+        plan.members, plan.posts, plan.posts_cached = members, len(likes) + cached, cached
+        if inactive is not None:
+            plan.inactive, plan.inactive_known = len(inactive), True
+        plan.estimate(likes, comments, scan=bool(amount or days))
+        return plan
+
+    def latency(self) -> float:
+        """Average latency of requests of the current operation, planner.DEFAULT_LATENCY until there are some"""
+        histogram = self.api.metrics.histograms['latency']
+        return histogram.sum / histogram.count if histogram.count else planner.DEFAULT_LATENCY
+
+    def calls_in_flight(self) -> int:
+        """Concurrency of crawls and removals that uses the whole RPS budget of all the tokens"""
+        return planner.concurrency(self.api.pool.limit, len(self.api.pool) or 1, self.latency(),
+                                   self.api.batcher is not None)
+
+    def run(self, coroutine):
+        """
+        Runs *coroutine* on the loop of this bot, blocking the calling thread (one thread at a time).
+        If it fails or is cancelled, tasks it left on the loop (crawler workers, batch dispatchers...)
+        are cancelled too, so they do not wake up during the next operation
+        """
+        try:
+            return self.loop.run_until_complete(coroutine)
+        except BaseException:
+            leftovers = asyncio.all_tasks(self.loop)
+            for task in leftovers:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*leftovers, return_exceptions=True))
+            raise
+
+    def log_metrics(self, operation: str):
+        """Writes summary and full metrics of API requests of the last *operation* to the log"""
+        self.logger.log(f'{operation} metrics: {self.api.metrics.summary()}')
+        self.logger.log_event('metrics', operation=operation, **self.api.metrics.to_dict())
+
+    def for_group(self, group: dict = None):
+        """Returns a bot for *group* sharing API (with its rate limits), caches and logger with this one"""
+        bot = copy.copy(self)
+        bot.group, bot.inactive, bot.crawler, bot.activity, bot.journal = group, None, None, None, None
+        return bot
+
+    async def gather_groups(self, progress: Progress, group_ids: list, post_amount: int,
+                            exclude_active: bool = False, days: int = None) -> dict:
+        """Scans posts of all the groups concurrently, then finds inactive subscribers of each of them"""
+        bots = [self.for_group() for _ in group_ids]
+        found = await asyncio.gather(*[bot.find_group(group_id) for bot, group_id in zip(bots, group_ids)])
+        bots = {bot.group.get('id'): bot for bot, name in zip(bots, found) if name}
+        actives = {gid: IdSet() for gid in bots}
+        scans = asyncio.gather(*[bot.scan_posts(post_amount, actives[gid], days) for gid, bot in bots.items()])
+        await asyncio.gather(scans, self.timer(progress, task=scans))
+        if exclude_active:
+            everyone = IdSet()
+            for active in actives.values():
+                everyone.update(active)
+            actives = dict.fromkeys(bots, everyone)
+        inactive = await asyncio.gather(*[bot.filter_subscribers(actives[gid]) for gid, bot in bots.items()])
+        for bot, found in zip(bots.values(), inactive):
+            bot.inactive = found
+        return bots
+
+    def find_group_sync(self, group_id, remember: bool = True):
         """Synchronous variant of find_group() to call from main.Window"""
-        loop = asyncio.get_event_loop()
-        coroutine = self.find_group(group_id)
-        res = loop.run_until_complete(coroutine)
-        return res
+        return self.run(self.find_group(group_id, remember))
 
-    def delete(self, window: PySimpleGUI.Window, rps: int = 3) -> str:
+    def delete(self, progress: Progress = None, rps: int = 3) -> str:
         """
         :param rps: RPS limit
-        :param window:  reference to GUIController to tart timer
+        :param progress: subscriber to report progress to
         :returns: string with statistic about amount of deleted users
         Calls async delete_subs(). To use from main.Window"""
         self.logger.log(f'Deleting inactive users with rps={rps}')
         self.api.set_sema(rps)
-        loop = asyncio.get_event_loop()
-        return loop.run_until_complete(self.delete_subs(self.inactive, window))
+        gid = self.group.get('id')
+        if self.journal is None or self.journal.group_id != gid:
+            self.journal = DeletionJournal()
+            self.journal.start(gid, self.inactive)
+        return self.run(self.delete_subs(self.journal.pending, progress or Progress()))
+
+    @staticmethod
+    def pending_journal():
+        """:returns: journal of an unfinished deletion or None. Nothing is loaded into the bot, see resume()"""
+        journal = DeletionJournal()
+        return journal if journal.pending else None
+
+    def resume(self, journal: DeletionJournal = None) -> int:
+        """
+        :param journal: journal of pending_journal() the operator agreed to continue, read anew if not given
+        :returns: amount of users left to delete
+
+        Loads unfinished deletion from the journal, so delete() continues it
+        """
+        journal = journal or self.pending_journal()
+        if journal is None:
+            return 0
+        self.journal = journal
+        if not self.group or self.group.get('id') != journal.group_id:
+            self.group = {'id': journal.group_id}
+        self.inactive = journal.pending
+        self.logger.log(f'Resuming deletion from journal: {journal.summary()}')
+        return len(self.inactive)
 
     def collect_users_info(self):
         """Collect info about deleted users. To be called from synchronous func"""
-        loop = asyncio.get_event_loop()
-        return loop.run_until_complete(self.collect_info_call())
+        return self.run(self.collect_info_call())
 
-    async def collect_info_call(self):
-        """Makes actual API calls to gather data"""
-        response = await self.api.users.get(list(self.inactive), fields=['screen_name'])
-        return response
+    async def collect_info_call(self, chunk_size: int = 1000) -> list[UserInfo]:
+        """
+        :param chunk_size: IDs per users.get call (1000 is VK maximum)
+        :returns: list of UserInfo about self.inactive
 
-    async def delete_subs(self, uid_set: set[int], window: PySimpleGUI.Window):
-        """Makes actual API calls to delete subscribers"""
-        self.api.requests = 0
-        tasks = [self.timer(window, event='delete')]
-        for uid in uid_set:
-            task = asyncio.create_task(self.api.groups.remove_user(group_id=self.group.get('id'), user_id=uid))
-            tasks.append(task)
-        result = await asyncio.gather(*tasks)
-        counter = 0
-        for val in result[1:]:
-            if val == 1:
-                counter += 1
-            else:
-                self.logger.log('Could not delete a user')
-        return f"{counter} / {len(uid_set)} "
+        Makes actual API calls to gather data. Cached profiles are not requested again,
+        the rest is requested in chunks at the same time
+        """
+        uids = list(self.inactive)
+        known = self.profiles.get(uids) if self.profiles else dict()
+        missing = [uid for uid in uids if uid not in known]
+        tasks = [asyncio.create_task(self.api.users.get(user_ids=missing[i:i + chunk_size], fields=['screen_name']))
+                 for i in range(0, len(missing), chunk_size)]
+        users = [UserInfo(*row) for row in known.values()]
+        for task in asyncio.as_completed(tasks):
+            for user in await task:
+                users.append(UserInfo(user.id, user.first_name, user.last_name, user.screen_name or f'id{user.id}'))
+        if self.profiles:
+            self.profiles.put(users[len(known):])
+            self.profiles.commit()
+        self.logger.log(f'users info: {len(known)} from cache, {len(users) - len(known)} requested')
+        return users
+
+    async def delete_subs(self, uid_set: IdSet, progress: Progress, concurrency: int = None):
+        """
+        :param uid_set: IDs of users to delete, all of them must be in the plan of self.journal
+        :param progress: subscriber to report progress to
+        :param concurrency: max amount of removals in flight (sized for the RPS limit by default)
 
-    async def find_group(self, group_id: str):
-        """finds group and returns it's name on success and memorises it in parameter self.group"""
+        Makes actual API calls to delete subscribers. Every result is written to self.journal
+        """
+        self.api.reset_stats()
+        uids = iter(uid_set)
+        self.journal.open()
+        try:
+            concurrency = concurrency or self.calls_in_flight()
+            workers = asyncio.gather(*[self.remove_worker(uids) for _ in range(min(concurrency, len(uid_set)))])
+            await asyncio.gather(workers, self.timer(progress, event='delete', task=workers))
+        finally:
+            self.journal.close()
+        self.logger.log(self.journal.summary())
+        self.log_metrics('delete')
+        return f"{len(self.journal.done)} / {len(self.journal.planned)} "
+
+    async def remove_worker(self, uids):
+        """Removes users taken from shared iterator *uids* one by one"""
+        gid = self.group.get('id')
+        for uid in uids:
+            try:
+                ok = await self.api.groups.remove_user(group_id=gid, user_id=uid) == 1
+                reason = '' if ok else 'not removed'
+            except VKAPIError as ex:
+                ok, reason = False, f'error {ex.code}'
+            self.journal.record(uid, ok, reason)
+            if not ok:
+                self.logger.log(f'Could not delete user {uid}: {reason}')
+
+    async def find_group(self, group_id: str, remember: bool = True):
+        """finds group and returns it's name on success and memorises it in parameter self.group if *remember*"""
         try:
             result = await self.api.request(method='groups.getById', data={'group_id': group_id})
-            self.group = result.get('response')[0]
+            if remember:
+                self.group = result.get('response')[0]
             self.logger.log( result.get('response')[0].get('id'))
             return result.get('response')[0].get('name')
         except (IndexError, VKAPIError):
             self.logger.log(f"Group {group_id} not found")
             return None
 
-    async def gather_inactive(self, window: PySimpleGUI.Window, post_amount: int) -> set:
-        """Creates a set of sunscribers inactive within *post_amount* posts"""
-        posts = await self.get_posts(post_amount)
-        post_count = len(posts)
-        tasks = [self.timer(window)]
-        for i in range(post_count):  # likes
-            task = asyncio.create_task(self.get_liked(posts[i]))
-            tasks.append(task)
-        res_likes = await asyncio.gather(*tasks)
-
-        time.sleep(1)
-        tasks = [self.timer(window)]
-        for i in range(post_count):  # comments
-            task = asyncio.create_task(self.get_commented(posts[i]))
-            tasks.append(task)
-        res_comment = await asyncio.gather(*tasks)
-
-        active_uid_set = set()
-        for id_set in res_comment[1:]:
-            active_uid_set.update(id_set)
-        for id_list in res_likes[1:]:
-            active_uid_set.update(id_list)
-        self.logger.log(f'found {len(active_uid_set)} active users')
-        subs_set = await self.get_subscribers()
-        subs_set -= active_uid_set
-        return subs_set
-
-    async def get_subscribers(self) -> set:
+    async def gather_inactive(self, progress: Progress, post_amount: int, days: int = None) -> IdSet:
+        """Creates a set of sunscribers inactive within *post_amount* posts (of the last *days* days if given)"""
+        active_uid_set = IdSet()
+        self.activity = None
+        scan = asyncio.create_task(self.scan_posts(post_amount, active_uid_set, days))
+        await asyncio.gather(scan, self.timer(progress, task=scan))
+        return await self.filter_subscribers(active_uid_set)
+
+    async def resolve_inactive(self, progress: Progress, post_amount: int, days: int = None, patience: int = 500,
+                               min_gain: float = 0.001) -> IdSet:
+        """
+        :param progress: subscriber to report progress to
+        :param post_amount: max amount of posts to search through
+        :param days: search only through posts of the last *days* days
+        :param patience: API calls to make before checking whether the scan is still worth it
+        :param min_gain: share of subscribers the last *patience* calls must prove active for the scan to go on
+
+        Early-exit variant of gather_inactive(). Subscribers are loaded first, then posts are scanned newest
+        first and every liker or commenter is crossed off the set of subscribers not proven active yet
+        (activity of non-members is not even stored). The scan stops when that set becomes empty or stops
+        shrinking, so for active groups it takes a fraction of the requests. The price: activity on older
+        posts is not seen once the scan has stopped
+        """
+        self.crawler = None
+        self.activity = MemberActivity(await self.get_subscribers())
+        scan = asyncio.create_task(self.scan_newest(post_amount, days, patience, min_gain))
+        await asyncio.gather(scan, self.timer(progress, task=scan))
+        self.logger.log(f'early exit: {scan.result()}; {self.activity.remaining} of {len(self.activity.ids)} '
+                        f'subscribers not proven active after {self.api.calls} calls')
+        return self.activity.unproven()
+
+    async def scan_newest(self, post_amount: int, days: int, patience: int, min_gain: float) -> str:
+        """Runs the crawl of resolve_inactive() until it ends or is not worth it anymore. Returns the reason"""
+        self.crawler = CommentCrawler(self.api, -self.group.get('id'), self.activity, self.calls_in_flight())
+        self.crawler.start()
+        crawl = asyncio.create_task(self.crawl_newest(post_amount, days))
+        watch = asyncio.create_task(self.watch_activity(patience, max(1, int(len(self.activity.ids) * min_gain))))
+        try:
+            done, _ = await asyncio.wait({crawl, watch}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            crawl.cancel()
+            watch.cancel()
+            self.crawler.stop()
+        if crawl in done:
+            crawl.result()  # errors of the crawl
+            return 'all posts scanned'
+        return watch.result()
+
+    async def crawl_newest(self, post_amount: int, days: int = None):
+        """Likes and comments of posts, newest first, into self.activity"""
+        gid = self.group.get('id')
+        likes = list()
+        try:
+            async for posts in self.iter_posts_since(days, post_amount):
+                for post in posts:
+                    cached = self.cache.get(gid, post) if self.cache else None
+                    if cached is not None:
+                        self.activity.update(cached)
+                        continue
+                    likes.append(asyncio.create_task(self.get_liked(post, self.activity)))
+                    self.crawler.add(post)
+            await asyncio.gather(*likes)
+            await self.crawler.join()
+        finally:
+            for task in likes:
+                task.cancel()
+            if self.cache:
+                self.cache.commit()  # cache.get() marks the reused posts as used
+
+    async def watch_activity(self, patience: int, min_gain: int) -> str:
+        """Returns once no subscriber is left to prove active or *patience* calls proved fewer than *min_gain*"""
+        calls, remaining = self.api.calls, self.activity.remaining
+        while self.activity.remaining:
+            await asyncio.sleep(0.1)
+            if self.api.calls - calls >= patience:
+                if remaining - self.activity.remaining < min_gain:
+                    return f'last {self.api.calls - calls} calls proved {remaining - self.activity.remaining} active'
+                calls, remaining = self.api.calls, self.activity.remaining
+        return 'every subscriber is proven active'
+
+    async def filter_subscribers(self, active: IdSet) -> IdSet:
+        """:returns: set of subscribers of self.group not in *active*"""
+        inactive = IdSet()
+        async for chunk in self.iter_subscribers():
+            inactive.update(IdSet(chunk) - active)
+        return inactive
+
+    async def scan_posts(self, post_amount: int, active: IdSet, days: int = None):
+        """
+        :param post_amount: amount of posts to search through (max amount if *days* is given)
+        :param active: set of active users' IDs to fill
+        :param days: search only through posts of the last *days* days
+
+        Single stage pipeline: likes and comments of every post are scheduled as soon as its page of
+        the wall arrives, all sharing the rate limiter of self.api. Posts unchanged since they
+        were cached are not crawled at all
+        """
+        gid = self.group.get('id')
+        self.crawler = CommentCrawler(self.api, -gid, active, self.calls_in_flight())
+        self.crawler.start()
+        likes = list()
+        crawled = list()  # (post, set of its active users) to be cached
+        reused = 0
+        pages = self.iter_posts_since(days, post_amount) if days else self.iter_posts(post_amount)
+        async for posts in pages:
+            for post in posts:
+                cached = self.cache.get(gid, post) if self.cache else None
+                if cached is not None:
+                    active.update(cached)
+                    reused += 1
+                    continue
+                users = IdSet() if self.cache else active
+                crawled.append((post, users))
+                likes.append(asyncio.create_task(self.get_liked(post, users)))
+                self.crawler.add(post, users)
+        await asyncio.gather(*likes)
+        await self.crawler.join()
+        if self.cache:
+            for post, users in crawled:
+                active.update(users)
+                self.cache.put(gid, post, users)
+            self.cache.commit()
+            self.logger.log(f'activity cache: {reused} posts reused, {len(crawled)} posts crawled')
+        self.logger.log(f'group {gid}: comments crawled: {self.crawler.pages_done} pages, '
+                        f'{self.crawler.threads_skipped} threads resolved from preview, '
+                        f'{len(active)} active users found')
+
+    async def get_subscribers(self) -> IdSet:
         """
         :returns: set of subscribers of self.group
         """
-        response = await self.api.groups.get_members(group_id=self.group.get('id'))
-        id_set = set(response.items)
+        id_set = IdSet()
+        async for chunk in self.iter_subscribers():
+            id_set.update(chunk)
         return id_set
 
-    async def get_liked(self, post):
-        """Get IDs of users who liked the post
+    async def iter_subscribers(self, page_size: int = 1000, window: int = 50):
+        """
+        :param page_size: members per groups.getMembers call (1000 is VK maximum)
+        :param window: max amount of pages requested at the same time
+        :returns: async generator of arrays with IDs of subscribers of self.group
+
+        Pages through all the members, so groups bigger than one page are not truncated.
+        Pages are yielded in order of arrival, not in order of offsets
         """
-        response = await self.api.likes.get_list(type='post', owner_id=-self.group.get('id'), item_id=post.id)
+        response = await self.api.groups.get_members(group_id=self.group.get('id'), count=page_size)
+        yield array('q', response.items)
+        offsets = iter(range(page_size, response.count, page_size))
+        pending = set()
+        try:
+            while True:
+                for offset in islice(offsets, window - len(pending)):
+                    pending.add(asyncio.create_task(self.get_members_page(offset, page_size)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield array('q', task.result())
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_members_page(self, offset: int, count: int) -> list:
+        response = await self.api.groups.get_members(group_id=self.group.get('id'), offset=offset, count=count)
         return response.items
 
-    async def get_commented(self, post) -> set:
-        """Get set of IDs of users who commented the post"""
-        comments_count = post.comments.count
-        users = set()
-        for i in range(comments_count // 100 + 1):
-            response = await self.api.wall.get_comments(owner_id=-self.group.get('id'), post_id=post.id, count=100,
-                                                        offset=100 * i, sort='asc', preview_length=1)
-            for comment in response.items:
-                if comment.thread.count > 0:  # if comment has thread with other comments under it
-                    thread_comments = comment.thread.count
-                    for j in range(thread_comments // 100 + 1):
-                        response1 = await self.api.wall.get_comments(owner_id=-self.group.get('id'), post_id=post.id,
-                                                                     count=100, offset=100 * j, sort='asc', preview_length=1,
-                                                                     comment_id=comment.id)
-                        users.update([comm.from_id for comm in response1.items])
-                users.add(comment.from_id)
-        return users
+    async def get_liked(self, post, active: IdSet, page_size: int = 1000) -> int:
+        """
+        :param post: post to get likers of
+        :param active: set of active users' IDs to add likers to
+        :param page_size: likers per likes.getList call (1000 is VK maximum)
+        :returns: amount of likers of the post
+
+        Adds IDs of all users who liked the post to *active*. Pages after the first one are requested
+        at the same time and merged as they arrive
+        """
+        response = await self.get_likes_page(post, 0, page_size)
+        active.update(response.items)
+        tasks = [asyncio.create_task(self.get_likes_page(post, offset, page_size))
+                 for offset in range(page_size, response.count, page_size)]
+        for task in asyncio.as_completed(tasks):
+            active.update((await task).items)
+        return response.count
+
+    async def get_likes_page(self, post, offset: int, count: int):
+        return await self.api.likes.get_list(type='post', owner_id=-self.group.get('id'), item_id=post.id,
+                                             offset=offset, count=count)
 
     async def get_wall(self, index: int, count: int):
         gid = self.group.get('id')
-        response = await self.api.wall.get(owner_id=-gid, offset=100 * index, count=count - 100 * index)
+        response = await self.api.wall.get(owner_id=-gid, offset=100 * index, count=min(100, count - 100 * index))
         return response.items
 
     async def get_posts(self, amount: int):
         """Get required amount of posts in a list"""
+        return [post async for posts in self.iter_posts(amount) for post in posts]
+
+    async def iter_posts(self, amount: int):
+        """Async generator of pages of posts (required amount in total), in order of arrival"""
         if self.group:
             gid = self.group.get('id')
             response = await self.api.wall.get(owner_id=-gid, count=1)  # amount of all the posts from group
             max_count = response.count
             count = min([amount, max_count])
             tasks = list()
-            for i in range(count // 100 + 1):
+            for i in range(-(-count // 100)):
                 tasks.append(asyncio.create_task(self.get_wall(i, count)))
-            result = await(asyncio.gather(*tasks))
-            return [r for res in result for r in res]
-
-    async def timer(self, window: PySimpleGUI.Window, event: str = 'search'):
-        if event == 'search':
-            while self.api.sema.queued_calls:
-                event, value = window.read(1)  # wait for event, return in 1 ms anyway to update window
-                if event == PySimpleGUI.WIN_CLOSED:
-                    self.close_connection()
-                    self.logger.close()
-                    exit(-1)
-                message = f"Производится поиск... Выполнено запросов: {self.api.requests} "
-                window.find_element(key='group_name').update(message)
-                await asyncio.sleep(1.1)
-        elif event == 'delete':
-            while self.api.sema.queued_calls:
-                event, value = window.read(1)  # wait for event, return in 1 ms anyway to update window
-                if event == PySimpleGUI.WIN_CLOSED:
-                    self.close_connection()
-                    self.logger.close()
-                    exit(-1)
-                message = f"Чистка в процессе... Прогресс: {self.api.requests} / {len(self.inactive)}"
-                window.find_element(key='delete progress').update(message)
-                await asyncio.sleep(1.1)
-        else:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+
+    async def iter_posts_since(self, days: int = None, limit: int = None, page_size: int = 100):
+        """
+        :param days: age of the oldest post to yield (no limit if None)
+        :param limit: max amount of posts to yield
+        :param page_size: posts per wall.get call (100 is VK maximum)
+
+        Async generator of pages of posts of the last *days* days, newest first. Pages are requested
+        one after another (the next one while the current is being processed) and the first page
+        reaching older posts is the last one
+        """
+        gid = self.group.get('id')
+        cutoff = time.time() - days * 24 * 3600 if days else 0
+        offset, yielded = 0, 0
+        page = asyncio.create_task(self.api.wall.get(owner_id=-gid, offset=offset, count=page_size))
+        try:
+            while page:
+                response = await page
+                offset += page_size
+                # pinned post stays on top of the wall whatever its age
+                reached = any(post_timestamp(post) < cutoff and not post.is_pinned for post in response.items)
+                posts = [post for post in response.items if post_timestamp(post) >= cutoff]
+                if limit is not None:
+                    posts = posts[:limit - yielded]
+                yielded += len(posts)
+                page = None
+                if not reached and offset < response.count and (limit is None or yielded < limit):
+                    page = asyncio.create_task(self.api.wall.get(owner_id=-gid, offset=offset, count=page_size))
+                if posts:
+                    yield posts
+        finally:
+            if page:
+                page.cancel()
+
+    async def timer(self, progress: Progress, event: str = 'search', task: asyncio.Future = None):
+        """
+        :param progress: subscriber to report progress to
+        :param event: 'search' or 'delete'
+        :param task: task to wait for besides the queued API calls
+
+        Reports progress every progress.interval seconds while *task* runs (while API calls are being made if
+        there is no task) and returns as soon as it is done, not at the next tick.
+        Cancels *task* and raises OperationCancelled once progress.cancelled() is True
+        """
+        if event not in ('search', 'delete'):
             raise ValueError(f'VkUserBot.timer(): illegal argument: {event}')
+        while not task.done() if task else self.api.pool.queued_calls:
+            if progress.cancelled():
+                if task:
+                    task.cancel()
+                raise OperationCancelled(event)
+            if event == 'search':
+                message = f"Производится поиск... Выполнено запросов: {self.api.requests} "
+                if self.crawler:
+                    message += f"Комментарии: {self.crawler.pages_done} / {self.crawler.pages_total} "
+                if self.activity:
+                    message += f"Не подтверждено: {self.activity.remaining}"
+                progress.update(event, message, self.api.requests)
+            else:
+                done, total = len(self.journal.done), len(self.journal.planned)
+                progress.update(event, f"Чистка в процессе... Прогресс: {done} / {total}", done, total)
+            if task:
+                await asyncio.wait({task}, timeout=progress.interval)
+            else:
+                await asyncio.sleep(progress.interval)
 
     def close_connection(self):
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.api.http_client.close())
+        """Closes the connection pool, reconnect() opens a new one on the first request"""
+        if self.journal:
+            self.journal.close()
+        self.run(self.http.close())
         self.api = None
 
     def reconnect(self):
-        self.api = MyAPI(token=read_token())
+        """New API with tokens re-read, still using the connection pool of this bot"""
+        self.api = MyAPI(token=reload_config().tokens, http_client=self.http)
 
 
-def file_dump(inactive: set):
+def file_dump(inactive: IdSet):
     with open(file='inactive.txt', mode='w') as file:
         file.write(f'Всего неактивных: {len(inactive)}\nСписок пользователей (по их ID):')
         for uid in inactive:
@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+from rls import TokenDropped, TOKEN_ERROR_CODES
+from vkbottle import VKAPIError
+
+# Methods that are safe to pack into VKScript `execute` calls
+BATCHABLE_METHODS = frozenset({
+    'groups.getMembers',
+    'groups.removeUser',
+    'likes.getList',
+    'users.get',
+    'wall.get',
+    'wall.getComments',
+})
+EXECUTE_LIMIT = 25  # max API calls VK allows inside a single execute
+
+
+class ExecuteBatcher:
+    """
+    Packs queued API calls into `execute` requests of up to EXECUTE_LIMIT calls each.
+
+    A batch is formed only when the rate limiter lets a request through, so every request slot
+    carries as many queued calls as possible. Each caller gets its own {'response': ...} dict back,
+    so vkbottle categories (api.wall.get() etc.) keep working on top of it.
+    """
+    def __init__(self, api, limit: int = EXECUTE_LIMIT):
+        self.api = api
+        self.limit = limit
+        self.pending = list()  # (method, params, future)
+        self.waiting = 0  # dispatchers queued in the rate limiter
+
+    @staticmethod
+    def accepts(method: str) -> bool:
+        return method in BATCHABLE_METHODS
+
+    async def submit(self, method: str, data: dict) -> dict:
+        """Queue a single call and wait for its own result"""
+        data = await self.api.validate_request(data)
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append((method, data, future))
+        if self.waiting * self.limit < len(self.pending):
+            self.waiting += 1
+            asyncio.create_task(self.dispatch())
+        return await future
+
+    async def dispatch(self):
+        """Wait for a rate limiter slot, then send everything queued so far (up to the limit)"""
+        slot, error = None, None
+        try:
+            slot = await self.api.pool.acquire()
+        except Exception as ex:  # no tokens left
+            error = ex
+        finally:
+            self.waiting -= 1
+        # callers cancelled meanwhile (e.g. operation aborted) do not need their calls
+        self.pending = [call for call in self.pending if not call[2].done()]
+        batch, self.pending = self.pending[:self.limit], self.pending[self.limit:]
+        if not batch:
+            return
+        try:
+            if error:
+                raise error
+            # always execute, even a single call: errors of the whole request then mean a problem with the token
+            result = await self.api.post('execute', {'code': self.build_code(batch)}, slot)
+        except Exception as ex:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(ex)
+            return
+        self.resolve(batch, result, slot)
+
+    @staticmethod
+    def build_code(batch: list) -> str:
+        """Build VKScript code returning results of all calls of the batch as an array"""
+        calls = [f'API.{method}({json.dumps(data, ensure_ascii=False)})' for method, data, _ in batch]
+        return f'return [{",".join(calls)}];'
+
+    def resolve(self, batch: list, result: dict, slot):
+        """
+        Hand out results of execute to the callers. Failed calls come as `false` with errors listed in order.
+        Token errors of every call of the request take the token out of rotation, the calls then fail with
+        TokenDropped so that MyAPI.request repeats them with another token. A token error of only some calls
+        is about their own objects (e.g. a group manager can not be removed): those calls just fail with it
+        """
+        pool = self.api.pool
+        items = result.get('response') or [False] * len(batch)
+        errors = iter(result.get('execute_errors', []))
+        # consumed for gone callers too, to keep the order
+        errors = [next(errors, {}) if item is False else None for _, item in zip(batch, items)]
+        dropped = all(error and error.get('error_code') in TOKEN_ERROR_CODES for error in errors) and pool.drop(slot)
+        for (method, _, future), item, error in zip(batch, items, errors):
+            if error is not None:
+                self.api.metrics.errors[error.get('error_code', 0)] += 1
+            if future.done():
+                continue
+            if error is None:
+                future.set_result({'response': item})
+                continue
+            code = error.get('error_code', 0)
+            if code == 6:
+                slot.sema.slow_down()
+            elif dropped:
+                future.set_exception(TokenDropped(f'{method}: token #{len(pool.dropped)} dropped from rotation'))
+                continue
+            message = error.get('error_msg', f'{method} failed inside execute')
+            future.set_exception(VKAPIError[code](error_msg=message))
@@ -0,0 +1,80 @@
+"""
+Startup time benchmark: imports every entry point in a fresh interpreter with -X importtime and prints its
+import time and the packages it spends it on. Exits with code 1 if an entry point imports a package that
+must be deferred until first use, or exceeds the time budget, so startup regressions are caught.
+Exits with code 2 if an entry point could not be imported at all (e.g. PySimpleGUI is not installed),
+as it was not checked then.
+
+Usage: python bench_startup.py [--budget-ms 1000] [--top 8] [--runs 3]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import Counter
+
+OK, FAILED, UNCHECKED = 0, 1, 2  # results of bench() and exit codes
+
+HEAVY = ('vkbottle', 'pandas', 'openpyxl', 'pyarrow')
+# module -> packages it must not import by itself
+ENTRY_POINTS = {
+    'main': HEAVY,  # the window has to appear before the engine is loaded
+    'cli': HEAVY,  # VkUserBot is imported after the arguments are parsed
+    'VkUserBot': ('pandas', 'openpyxl', 'pyarrow'),  # reports are written much later, if at all
+}
+
+
+def import_times(module: str) -> list:
+    """:returns: (self us, cumulative us, module name) of every import done by a fresh `import module`"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(own), int(cumulative), name.strip()))
+    return times
+
+
+def bench(module: str, forbidden: tuple, runs: int, top: int, budget_ms: float) -> int:
+    """Prints the best of *runs* measurements of *module*, returns FAILED if it breaks the rules"""
+    try:
+        measurements = [import_times(module) for _ in range(runs)]
+    except RuntimeError as ex:
+        print(f'{module}: NOT CHECKED, cannot be imported here ({ex})')
+        return UNCHECKED
+    times = min(measurements, key=lambda t: next(c for _, c, name in t if name == module))
+    total = next(cumulative for _, cumulative, name in times if name == module) / 1000
+    packages = Counter()
+    for own, _, name in times:
+        packages[name.split('.')[0]] += own
+    print(f'{module}: {total:.0f} ms, ' + ', '.join(f'{name} {us / 1000:.0f} ms' for name, us in packages.most_common(top)))
+    result = OK
+    loaded = sorted(set(packages) & set(forbidden))
+    if loaded:
+        print(f'    FAIL: imports {", ".join(loaded)} at startup')
+        result = FAILED
+    if budget_ms and total > budget_ms:
+        print(f'    FAIL: over the budget of {budget_ms:.0f} ms')
+        result = FAILED
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Import time of the entry points')
+    parser.add_argument('--budget-ms', type=float, default=1000., help='max import time of main and cli, 0 for none')
+    parser.add_argument('--top', type=int, default=8, help='packages to list per entry point')
+    parser.add_argument('--runs', type=int, default=3, help='measurements per entry point, the best one is shown')
+    args = parser.parse_args(argv)
+    results = set()
+    for module, forbidden in ENTRY_POINTS.items():
+        budget = args.budget_ms if module != 'VkUserBot' else 0  # loaded in background, informational
+        results.add(bench(module, forbidden, args.runs, args.top, budget))
+    return FAILED if FAILED in results else max(results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+End-to-end benchmark of scanning and deletion against fake_vk.py, no real VK account needed.
+
+The fake server runs in a subprocess (so its CPU time does not count against the client), VkUserBot talks
+to it through MyAPI(api_url=...). gather_inactive() and then delete_subs() are run on a synthetic group;
+for each phase total time, HTTP requests per second, API calls and peak Python memory are printed, and the
+found inactive users are checked against the generated ground truth.
+
+Usage: python bench_vk.py [--members 20000] [--posts 300] [--rps 20] [--tokens 1] [--latency 0.05]
+                          [--error-rate 0.01] [--server-rps 25] [--active-share 0.3] [--early-exit] [--no-delete]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fake_vk import FakeGroup
+from journal import DeletionJournal
+from logger import Logger
+from progress import Progress
+from VkUserBot import MyAPI, VkUserBot
+
+
+def start_server(args) -> tuple:
+    """:returns: server process and its API URL"""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_vk.py'),
+               '--members', str(args.members), '--posts', str(args.posts), '--seed', str(args.seed),
+               '--active-share', str(args.active_share),
+               '--latency', str(args.latency), '--error-rate', str(args.error_rate), '--port', '0']
+    if args.server_rps:
+        command += ['--rps', str(args.server_rps)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if ' at ' not in line:
+        server.kill()
+        raise RuntimeError(f'fake VK server did not start: {line!r}')
+    return server, line.rsplit(' at ', 1)[1].strip()
+
+
+def measure(name: str, vk: VkUserBot, coroutine):
+    """Runs *coroutine* on the loop of *vk* and prints time, request rate and peak memory"""
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = vk.run(coroutine)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    metrics = vk.api.metrics
+    requests, calls = sum(metrics.requests.values()), sum(metrics.calls.values())
+    print(f'{name}: {elapsed:.2f} s, {requests} requests ({requests / elapsed:.1f} req/s), '
+          f'{calls} calls ({calls / elapsed:.1f} calls/s), peak memory {peak / 2 ** 20:.1f} MiB')
+    print(f'    {metrics.summary()}')
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark against a fake VK API server')
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--posts', type=int, default=300)
+    parser.add_argument('--rps', type=int, default=20, help='client RPS limit per token')
+    parser.add_argument('--tokens', type=int, default=1, help='amount of (fake) tokens')
+    parser.add_argument('--latency', type=float, default=0.05, help='server latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='share of requests failed with error 6')
+    parser.add_argument('--server-rps', type=int, default=25, help='server RPS limit per token, 0 for none')
+    parser.add_argument('--no-batch', action='store_true', help='do not pack calls into execute')
+    parser.add_argument('--no-delete', action='store_true', help='benchmark the scan only')
+    parser.add_argument('--early-exit', action='store_true', help='scan with VkUserBot.resolve_inactive()')
+    parser.add_argument('--active-share', type=float, default=0.3, help='share of members who like or comment')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server, url = start_server(args)
+    workdir = tempfile.TemporaryDirectory(prefix='vkghostcleaner_bench_')
+    logger = Logger(os.path.join(workdir.name, 'log.txt'))
+    try:
+        vk = VkUserBot(logger, cache=False)
+        vk.api = MyAPI([f'token{i}' for i in range(args.tokens)], args.rps, batch=not args.no_batch, api_url=url,
+                       http_client=vk.http)
+        vk.group = {'id': 1, 'name': 'Fake group 1'}
+        print(f'{args.members} members, {args.posts} posts, {args.tokens} token(s) at {args.rps} RPS, '
+              f'server: latency {args.latency} s, error 6 rate {args.error_rate}, limit {args.server_rps} RPS')
+        tracemalloc.start()
+
+        vk.api.reset_stats()
+        search = vk.resolve_inactive if args.early_exit else vk.gather_inactive
+        inactive = measure('scan', vk, search(Progress(), args.posts))
+        expected = FakeGroup(members=args.members, posts=args.posts, active_share=args.active_share,
+                             seed=args.seed).expected_inactive(args.posts)
+        found = set(inactive)
+        print(f'    inactive: {len(found)} found, {len(expected)} expected, '
+              f'{len(found - expected)} false, {len(expected - found)} missed')
+
+        if not args.no_delete:
+            vk.journal = DeletionJournal(os.path.join(workdir.name, 'delete_journal.txt'))
+            vk.journal.start(vk.group['id'], inactive)
+            measure('delete', vk, vk.delete_subs(inactive, Progress()))
+            print(f'    {vk.journal.summary()}')
+        tracemalloc.stop()
+        vk.close_connection()
+    finally:
+        logger.close()
+        workdir.cleanup()
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
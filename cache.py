@@ -0,0 +1,92 @@
+import sqlite3
+import time
+from array import array
+
+
+class ActivityCache:
+    """
+    On-disk cache of active users of each post, keyed by (group_id, post_id).
+
+    An entry is valid while likes.count and comments.count of the post stay the same, so a rescan only
+    crawls posts that are new or changed. Entries not used for *max_age* days are evicted, and the cache
+    never keeps more than *max_posts* posts (least recently used go first).
+    """
+    def __init__(self, path: str = 'activity_cache.sqlite', max_posts: int = 50000, max_age: int = 90):
+        self.max_posts = max_posts
+        self.max_age = max_age * 24 * 3600
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS posts ('
+                        'group_id INTEGER, post_id INTEGER, likes INTEGER, comments INTEGER, '
+                        'users BLOB, used REAL, PRIMARY KEY (group_id, post_id))')
+
+    @staticmethod
+    def counts(post) -> tuple:
+        return (post.likes.count if post.likes else 0), (post.comments.count if post.comments else 0)
+
+    def get(self, group_id: int, post, touch: bool = True):
+        """
+        :param touch: mark the entry as used, so it is evicted later (written on the next commit())
+        :returns: array of IDs of users active on the *post* or None if the post is not cached or has changed
+        """
+        row = self.db.execute('SELECT likes, comments, users FROM posts WHERE group_id = ? AND post_id = ?',
+                              (group_id, post.id)).fetchone()
+        if row is None or tuple(row[:2]) != self.counts(post):
+            return None
+        if touch:
+            self.db.execute('UPDATE posts SET used = ? WHERE group_id = ? AND post_id = ?',
+                            (time.time(), group_id, post.id))
+        return array('q', row[2])
+
+    def put(self, group_id: int, post, users):
+        likes, comments = self.counts(post)
+        self.db.execute('INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?)',
+                        (group_id, post.id, likes, comments, array('q', users).tobytes(), time.time()))
+
+    def evict(self):
+        """Removes stale entries and the least recently used ones above the size limit"""
+        self.db.execute('DELETE FROM posts WHERE used < ?', (time.time() - self.max_age,))
+        self.db.execute('DELETE FROM posts WHERE rowid IN '
+                        '(SELECT rowid FROM posts ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_posts,))
+
+    def commit(self):
+        self.evict()
+        self.db.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+class ProfileCache:
+    """
+    On-disk cache of users' names and screen names for reports. Entries expire after *max_age* days.
+    Pass the connection of ActivityCache as *db* to share the file: a second connection would wait for
+    the write lock of the first one's uncommitted changes
+    """
+    def __init__(self, path: str = 'activity_cache.sqlite', max_age: int = 30, db: sqlite3.Connection = None):
+        self.max_age = max_age * 24 * 3600
+        self.db = db or sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS users ('
+                        'uid INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, screen_name TEXT, updated REAL)')
+
+    def get(self, uids: list) -> dict:
+        """
+        :returns: dict uid -> (uid, first_name, last_name, screen_name) for cached ones of *uids*
+        """
+        found = dict()
+        fresh = time.time() - self.max_age
+        for i in range(0, len(uids), 900):  # sqlite limits the amount of query parameters
+            chunk = uids[i:i + 900]
+            rows = self.db.execute(f'SELECT uid, first_name, last_name, screen_name FROM users '
+                                   f'WHERE updated >= ? AND uid IN ({",".join("?" * len(chunk))})', (fresh, *chunk))
+            found.update((row[0], row) for row in rows)
+        return found
+
+    def put(self, users: list):
+        """:param users: list of (uid, first_name, last_name, screen_name)"""
+        now = time.time()
+        self.db.executemany('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)', [(*user, now) for user in users])
+
+    def commit(self):
+        self.db.execute('DELETE FROM users WHERE updated < ?', (time.time() - self.max_age,))
+        self.db.commit()
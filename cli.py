@@ -0,0 +1,115 @@
+"""
+Headless entry point for server-side and cron runs.
+
+    python cli.py scan --group <id> [<id> ...] --posts <amount> [--days <days>] [--rps 3]
+                       [--report xlsx|csv|parquet] [--exclude-active] [--early-exit]
+    python cli.py delete --group <id> --posts <amount> [--days <days>] [--rps 3] [--early-exit]
+    python cli.py delete --resume [--rps 3]
+
+Add --dry-run to print estimated requests and time of the operation instead of running it.
+"""
+import argparse
+import sys
+
+from logger import Logger
+from progress import ConsoleProgress
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='vkghostcleaner', description='Search and removal of inactive subscribers')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan = commands.add_parser('scan', help='find inactive subscribers and write a report')
+    delete = commands.add_parser('delete', help='find inactive subscribers and remove them')
+    scan.add_argument('--group', nargs='+', help='IDs or short names of the groups, scanned at the same time')
+    scan.add_argument('--exclude-active', action='store_true',
+                      help='with several groups: users active in any of them are not inactive')
+    delete.add_argument('--group', help='ID or short name of the group')
+    for command in (scan, delete):
+        command.add_argument('--posts', type=int, help='amount of latest posts to search through')
+        command.add_argument('--days', type=int, help='search only through posts of the last DAYS days '
+                                                      '(--posts is then the max amount of posts)')
+        command.add_argument('--rps', type=int, default=3, help='max requests per second per token (3..100)')
+        command.add_argument('--report', choices=['xlsx', 'csv', 'parquet'], default='xlsx',
+                             help='format of the report about inactive users')
+        command.add_argument('--early-exit', action='store_true',
+                             help='load subscribers first and stop the scan once their activity is not found '
+                                  'anymore: much faster for active groups, may miss activity on older posts')
+        command.add_argument('--dry-run', action='store_true',
+                             help='only estimate requests and time of the scan, the report and the deletion')
+        command.add_argument('--connections', type=int, default=100, help='max amount of open HTTP connections')
+        command.add_argument('--metrics', metavar='FILE',
+                             help='save request metrics of the last operation (Prometheus text for .prom, else JSON)')
+    delete.add_argument('--resume', action='store_true', help='continue unfinished deletion from the journal')
+    args = parser.parse_args(argv)
+    if not getattr(args, 'resume', False) and not args.group:
+        parser.error('--group is required')
+    if not getattr(args, 'resume', False) and not args.days and (not args.posts or args.posts <= 0):
+        parser.error('positive --posts or --days is required')
+    if args.days is not None and args.days <= 0:
+        parser.error('--days must be positive')
+    if args.early_exit and args.command == 'scan' and len(args.group or []) > 1:
+        parser.error('--early-exit works with a single group')
+    if args.rps not in range(3, 101):
+        parser.error('--rps must be within 3..100')
+    return args
+
+
+def dry_run(vk, args) -> int:
+    """Prints the estimates for every group (or for the unfinished deletion) without running anything"""
+    if getattr(args, 'resume', False):
+        journal = vk.pending_journal()
+        if journal is None:
+            print('Nothing to resume', file=sys.stderr)
+            return 1
+        print(vk.dry_run(None, args.rps, journal=journal).summary())
+        return 0
+    for group in args.group if isinstance(args.group, list) else [args.group]:
+        if not vk.find_group_sync(group):
+            print(f'Group {group} not found', file=sys.stderr)
+            return 1
+        print(f'{group}: {vk.dry_run(args.posts, args.rps, args.days).summary()}')
+    return 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    from VkUserBot import VkUserBot  # heavy (vkbottle), so --help and argument errors stay instant
+    logger = Logger()
+    vk = VkUserBot(logger, connections=args.connections)
+    progress = ConsoleProgress()
+    try:
+        if args.dry_run:
+            return dry_run(vk, args)
+        if getattr(args, 'resume', False):
+            if not vk.resume():
+                print('Nothing to resume', file=sys.stderr)
+                return 1
+            print(f'Resuming deletion in group {vk.group.get("id")}: {len(vk.inactive)} users left')
+        elif args.command == 'scan' and len(args.group) > 1:
+            bots, cross = vk.find_inactive_groups(args.group, args.posts, progress, args.rps, args.exclude_active,
+                                                  args.report, args.days)
+            for gid, bot in bots.items():
+                print(f'{gid}: inactive: {len(bot.inactive)}')
+            print(f'Inactive in several groups: {len(cross)}')
+        else:
+            group = args.group[0] if isinstance(args.group, list) else args.group
+            if not vk.find_group_sync(group):
+                print(f'Group {group} not found', file=sys.stderr)
+                return 1
+            inactive = vk.find_inactive(args.posts, progress, args.rps, args.report, args.days, args.early_exit)
+            print(f'Inactive: {len(inactive)}')
+        if args.command == 'delete':
+            print(f'Deleted: {vk.delete(progress, args.rps)}')
+        print(f'Requests: {vk.api.metrics.summary()}', file=sys.stderr)
+        if args.metrics:
+            vk.api.metrics.save(args.metrics)
+        for path in vk.failed_reports:
+            print(f'Report {path} could not be written', file=sys.stderr)
+        return 1 if vk.failed_reports else 0
+    finally:
+        vk.close_connection()
+        logger.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
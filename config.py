@@ -0,0 +1,42 @@
+"""
+Settings read from files once per process and shared by the GUI, the CLI and VkUserBot.
+Kept free of heavy imports: it is loaded before the window is shown
+"""
+TOKEN_FILE = 'token.txt'
+
+
+def read_tokens(path: str = TOKEN_FILE) -> list:
+    """Read access tokens from token.txt, one per line"""
+    try:
+        with open(file=path, mode='r') as file:
+            return [line.strip() for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class Config:
+    def __init__(self, tokens: list):
+        self.tokens = tokens  # access tokens from token.txt
+
+    @property
+    def token(self):
+        """The first token or None"""
+        return self.tokens[0] if self.tokens else None
+
+
+_config = None
+
+
+def get_config() -> Config:
+    """Config read on the first call, the same object afterwards"""
+    global _config
+    if _config is None:
+        _config = Config(read_tokens())
+    return _config
+
+
+def reload_config() -> Config:
+    """Reads the files again, e.g. after token.txt was edited"""
+    global _config
+    _config = None
+    return get_config()
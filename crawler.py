@@ -0,0 +1,113 @@
+import asyncio
+
+
+class CommentCrawler:
+    """
+    Crawls comments of many posts at once.
+
+    Every page of top-level comments and every page of a thread is a separate job in a shared queue,
+    processed by a bounded pool of workers, so the requests of all the posts overlap within the RPS limit.
+    Threads are previewed inline (thread_items_count), so short threads cost no extra requests.
+    """
+    def __init__(self, api, owner_id: int, active: set, workers: int = 50, page_size: int = 100,
+                 thread_preview: int = 10):
+        """
+        :param api: MyAPI instance
+        :param owner_id: owner_id of the wall (negative for groups)
+        :param active: set of active users' IDs to add commenters to (or idset.MemberActivity)
+        :param workers: max amount of pages requested at the same time
+        :param page_size: comments per wall.getComments call (100 is VK maximum)
+        :param thread_preview: thread comments returned inline with top-level ones (10 is VK maximum)
+        """
+        self.api = api
+        self.owner_id = owner_id
+        self.active = active
+        self.workers = workers
+        self.page_size = page_size
+        self.thread_preview = thread_preview
+        self.queue = asyncio.Queue()
+        self.errors = list()
+        self.pages_done = 0
+        self.pages_total = 0
+        self.threads_skipped = 0
+        self.tasks = list()
+        self.targets = dict()  # post_id -> set to add commenters of that post to, if not self.active
+
+    def put(self, post_id: int, comment_id: int = None, offset: int = 0):
+        self.pages_total += 1
+        self.queue.put_nowait((post_id, comment_id, offset))
+
+    def start(self):
+        """Starts the workers. Posts can be added with add() while the crawl is running"""
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    def add(self, post, active: set = None):
+        """
+        :param post: post to crawl comments of
+        :param active: set to add commenters of this post to (self.active by default)
+        """
+        if active is not None:
+            self.targets[post.id] = active
+        if post.comments and post.comments.count:
+            self.put(post.id)
+
+    async def join(self) -> set:
+        """Waits until every queued page is crawled, stops the workers and returns set of active users' IDs"""
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        if self.errors:
+            raise self.errors[0]
+        return self.active
+
+    def stop(self):
+        """Cancels the workers and drops the pages still queued, e.g. when the scan ends early"""
+        for task in self.tasks:
+            task.cancel()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+
+    async def crawl(self, posts: list) -> set:
+        """Crawls comments of all the *posts* and returns set of active users' IDs"""
+        self.start()
+        for post in posts:
+            self.add(post)
+        return await self.join()
+
+    async def worker(self):
+        while True:
+            post_id, comment_id, offset = await self.queue.get()
+            try:
+                if not self.errors:
+                    await self.fetch(post_id, comment_id, offset)
+            except Exception as ex:
+                self.errors.append(ex)
+            finally:
+                self.pages_done += 1
+                self.queue.task_done()
+
+    async def fetch(self, post_id: int, comment_id: int, offset: int):
+        """Requests a single page of comments (of a thread if *comment_id* is given) and queues the follow-ups"""
+        params = dict(owner_id=self.owner_id, post_id=post_id, count=self.page_size, offset=offset,
+                      sort='asc', preview_length=1)
+        if comment_id:
+            params['comment_id'] = comment_id
+        else:
+            params['thread_items_count'] = self.thread_preview
+        response = await self.api.wall.get_comments(**params)
+        if offset == 0:
+            level_count = response.current_level_count or response.count
+            for next_offset in range(self.page_size, level_count, self.page_size):
+                self.put(post_id, comment_id, next_offset)
+        active = self.targets.get(post_id, self.active)
+        for comment in response.items:
+            active.add(comment.from_id)
+            if comment_id or not comment.thread or not comment.thread.count:
+                continue
+            preview = comment.thread.items or []
+            active.update(reply.from_id for reply in preview)
+            if comment.thread.count > len(preview):
+                self.put(post_id, comment.id)
+            else:
+                self.threads_skipped += 1
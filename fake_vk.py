@@ -0,0 +1,306 @@
+"""
+Local stand-in for VK API to measure scanning and deletion without touching real VK.
+
+Serves a synthetic group over plain HTTP (stdlib asyncio only) at http://<host>:<port>/method/<name>,
+so MyAPI(token, api_url=server.url) works against it unchanged. Latency, random error 6 and
+per-token rate limits can be injected.
+
+Usage: python fake_vk.py [--members 10000] [--posts 1000] [--port 8080]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, deque
+from urllib.parse import parse_qsl, urlsplit
+
+EXECUTE_LIMIT = 25
+
+
+class FakeGroup:
+    """Synthetic group: members, posts, likes and comments generated from a seed"""
+    def __init__(self, group_id: int = 1, members: int = 10000, posts: int = 1000, active_share: float = 0.3,
+                 likes_per_post: int = 50, comments_per_post: int = 10, thread_share: float = 0.2,
+                 outsiders_share: float = 0.1, post_interval: int = 6 * 3600, seed: int = 0, managers: tuple = (),
+                 pinned: int = None):
+        """
+        :param group_id: ID of the group
+        :param members: amount of subscribers
+        :param posts: amount of posts on the wall
+        :param active_share: share of members who like and comment at all
+        :param likes_per_post: average amount of likes of a post
+        :param comments_per_post: average amount of top-level comments of a post
+        :param thread_share: share of comments having a thread of replies
+        :param outsiders_share: share of likes and comments made by non-members
+        :param post_interval: seconds between two posts
+        :param seed: seed of the generator
+        :param managers: IDs of members that can not be removed: groups.removeUser fails with error 15 for them
+        :param pinned: ID of the post pinned on top of the wall, whatever its age
+        """
+        rng = random.Random(seed)
+        self.id = group_id
+        self.name = f'Fake group {group_id}'
+        self.members = list(range(1000000, 1000000 + members))
+        self.removed = set()
+        self.managers = frozenset(managers)
+        active = rng.sample(self.members, int(members * active_share))
+        outsiders = list(range(1, max(2, int(members * outsiders_share) + 1)))
+
+        def someone():
+            return rng.choice(outsiders) if rng.random() < outsiders_share else rng.choice(active)
+
+        now = int(time.time())
+        self.posts = list()
+        for post_id in range(posts, 0, -1):  # newest first, as on the wall
+            likers = list({someone() for _ in range(rng.randint(0, 2 * likes_per_post))}) if active else []
+            comments = list()
+            for comment_id in range(rng.randint(0, 2 * comments_per_post) if active else 0):
+                thread = [someone() for _ in range(rng.randint(1, 30))] if rng.random() < thread_share else []
+                comments.append((someone(), thread))
+            date = now - (posts - post_id) * post_interval
+            self.posts.append({'id': post_id, 'date': date, 'likers': likers, 'comments': comments, 'is_pinned': 0})
+        if pinned:
+            post = next(post for post in self.posts if post['id'] == pinned)
+            self.posts.remove(post)
+            self.posts.insert(0, dict(post, is_pinned=1))
+        self.post_index = {post['id']: post for post in self.posts}
+
+    def expected_inactive(self, post_amount: int, days: int = None) -> set:
+        """Subscribers inactive within the latest *post_amount* posts (of the last *days* days if given)"""
+        posts = self.posts
+        if days:
+            cutoff = time.time() - days * 24 * 3600
+            posts = [post for post in posts if post['date'] >= cutoff]
+        active = set()
+        for post in posts[:post_amount]:
+            active.update(post['likers'])
+            for from_id, thread in post['comments']:
+                active.add(from_id)
+                active.update(thread)
+        return set(self.members) - self.removed - active
+
+
+class VKError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class FakeVkServer:
+    def __init__(self, groups: list, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.,
+                 rps: int = None, seed: int = 0, readonly_tokens: tuple = ()):
+        """
+        :param groups: FakeGroup instances to serve
+        :param latency: seconds every request takes
+        :param jitter: max random addition to latency
+        :param error_rate: probability of error 6 for any request
+        :param rps: max requests per second per token, error 6 above it (None for no limit)
+        :param readonly_tokens: tokens of non-admins: groups.removeUser fails with error 15 for them
+        """
+        self.groups = {group.id: group for group in groups}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rps = rps
+        self.readonly_tokens = frozenset(readonly_tokens)
+        self.rng = random.Random(seed)
+        self.token_calls = dict()  # token -> deque of times of the last requests
+        self.requests = Counter()  # HTTP requests per method
+        self.calls = Counter()  # API methods called, inside execute included
+        self.errors = Counter()
+        self.server = None
+        self.url = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f'http://{host}:{port}/method/'
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP/1.1 with keep-alive: form-urlencoded POST or GET in, JSON out"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                target = request_line.decode().split(' ')[1]
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode().split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                url = urlsplit(target)
+                params = dict(parse_qsl(url.query))
+                params.update(parse_qsl(body.decode()))
+                payload = json.dumps(await self.request(url.path.rsplit('/', 1)[-1], params)).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=utf-8\r\n'
+                             b'Content-Length: %d\r\n\r\n' % len(payload) + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def request(self, method: str, params: dict) -> dict:
+        self.requests[method] += 1
+        await asyncio.sleep(self.latency + self.rng.random() * self.jitter)
+        try:
+            token = params.get('access_token')
+            self.check_rate(token)
+            if method == 'execute':
+                return self.execute(params.get('code', ''), token)
+            return {'response': self.call(method, params, token)}
+        except VKError as error:
+            self.errors[error.code] += 1
+            return {'error': {'error_code': error.code, 'error_msg': error.message, 'request_params': []}}
+
+    def check_rate(self, token: str):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise VKError(6, 'Too many requests per second')
+        if self.rps:
+            now = time.monotonic()
+            calls = self.token_calls.setdefault(token, deque())
+            while calls and now - calls[0] >= 1.:
+                calls.popleft()
+            if len(calls) >= self.rps:
+                raise VKError(6, 'Too many requests per second')
+            calls.append(now)
+
+    def execute(self, code: str, token: str = None) -> dict:
+        """Runs code of the form `return [API.method({...}), ...];` as built by ExecuteBatcher"""
+        decoder = json.JSONDecoder()
+        results, errors = list(), list()
+        position = code.find('API.')
+        while position != -1:
+            bracket = code.index('(', position)
+            method = code[position + 4:bracket]
+            params, end = decoder.raw_decode(code, bracket + 1)
+            try:
+                results.append(self.call(method, {key: str(value) for key, value in params.items()}, token))
+            except VKError as error:
+                self.errors[error.code] += 1
+                results.append(False)
+                errors.append({'method': method, 'error_code': error.code, 'error_msg': error.message})
+            position = code.find('API.', end)
+        if len(results) > EXECUTE_LIMIT:
+            raise VKError(13, 'Runtime error: too many API calls')
+        response = {'response': results}
+        if errors:
+            response['execute_errors'] = errors
+        return response
+
+    def group(self, params: dict, key: str) -> FakeGroup:
+        group_id = abs(int(params.get(key, 0)))
+        if group_id not in self.groups:
+            raise VKError(100, 'One of the parameters specified was missing or invalid')
+        return self.groups[group_id]
+
+    def post(self, params: dict) -> dict:
+        post = self.group(params, 'owner_id').post_index.get(int(params.get('post_id', params.get('item_id', 0))))
+        if post is None:
+            raise VKError(100, 'Post not found')
+        return post
+
+    def call(self, method: str, params: dict, token: str = None):
+        self.calls[method] += 1
+        offset = int(params.get('offset', 0))
+        if method == 'groups.getById':
+            group_id = params.get('group_id', '')
+            group_id = int(group_id.replace('club', '')) if group_id.replace('club', '').isdigit() else 0
+            if group_id not in self.groups:
+                raise VKError(100, 'Group not found')
+            return [{'id': group_id, 'name': self.groups[group_id].name, 'screen_name': f'club{group_id}'}]
+        if method == 'groups.getMembers':
+            group = self.group(params, 'group_id')
+            count = min(int(params.get('count', 1000)), 1000)
+            members = [uid for uid in group.members if uid not in group.removed] if group.removed else group.members
+            return {'count': len(members), 'items': members[offset:offset + count]}
+        if method == 'wall.get':
+            group = self.group(params, 'owner_id')
+            count = min(int(params.get('count', 20)), 100)
+            return {'count': len(group.posts), 'items': [
+                {'id': post['id'], 'owner_id': -group.id, 'from_id': -group.id, 'date': post['date'], 'text': '',
+                 'is_pinned': post['is_pinned'],
+                 'likes': {'count': len(post['likers']), 'user_likes': 0, 'can_like': 1, 'can_publish': 1},
+                 'comments': {'count': sum(1 + len(thread) for _, thread in post['comments']), 'can_post': 1}}
+                for post in group.posts[offset:offset + count]]}
+        if method == 'likes.getList':
+            likers = self.post(params)['likers']
+            count = min(int(params.get('count', 100)), 1000)
+            return {'count': len(likers), 'items': likers[offset:offset + count]}
+        if method == 'wall.getComments':
+            return self.comments(params, offset)
+        if method == 'users.get':
+            uids = [int(uid) for uid in params.get('user_ids', '').split(',') if uid]
+            if len(uids) > 1000:
+                raise VKError(100, 'Too many user_ids')
+            return [{'id': uid, 'first_name': f'User{uid}', 'last_name': 'Fake', 'screen_name': f'id{uid}'}
+                    for uid in uids]
+        if method == 'groups.removeUser':
+            if token in self.readonly_tokens:
+                raise VKError(15, 'Access denied: no access to call this method')
+            group = self.group(params, 'group_id')
+            uid = int(params.get('user_id', 0))
+            if uid in group.managers:
+                raise VKError(15, 'Access denied: can not remove a manager')
+            group.removed.add(uid)
+            return 1
+        raise VKError(3, 'Unknown method passed')
+
+    def comments(self, params: dict, offset: int) -> dict:
+        post = self.post(params)
+        count = min(int(params.get('count', 10)), 100)
+        owner_id = int(params.get('owner_id'))
+        comment_id = int(params.get('comment_id', 0))
+        preview = min(int(params.get('thread_items_count', 0)), 10)
+
+        def comment(cid: int, from_id: int, thread: list = None) -> dict:
+            item = {'id': cid, 'from_id': from_id, 'post_id': post['id'], 'owner_id': owner_id, 'date': post['date'],
+                    'text': ''}
+            if thread is not None:
+                item['thread'] = {'count': len(thread), 'items': [comment(cid * 1000 + i + 1, uid)
+                                                                   for i, uid in enumerate(thread[:preview])]}
+            return item
+
+        if comment_id:
+            thread = post['comments'][comment_id - 1][1]
+            items = [comment(comment_id * 1000 + i + 1, uid) for i, uid in enumerate(thread)]
+        else:
+            items = [comment(i + 1, from_id, thread) for i, (from_id, thread) in enumerate(post['comments'])]
+        return {'count': len(items), 'current_level_count': len(items), 'items': items[offset:offset + count]}
+
+
+async def serve(args):
+    group = FakeGroup(members=args.members, posts=args.posts, active_share=args.active_share, seed=args.seed)
+    server = await FakeVkServer([group], latency=args.latency, error_rate=args.error_rate, rps=args.rps).start(
+        port=args.port)
+    print(f'Serving group {group.id} ({args.members} members, {args.posts} posts) at {server.url}', flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake VK API server')
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--active-share', type=float, default=0.3, help='share of members who like or comment')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--rps', type=int, default=None, help='per token rate limit')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8080, help='0 for any free port')
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
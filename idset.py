@@ -0,0 +1,147 @@
+import heapq
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy
+except ImportError:  # optional, makes set operations vectorized
+    numpy = None
+
+
+class IdSet:
+    """
+    Set of integer IDs stored as a sorted array of int64: 8 bytes per ID instead of ~60 for a set of ints.
+
+    Additions go to an unsorted buffer which is merged in lazily (on lookups, iteration or when it grows
+    big), so incremental add()/update() stay cheap. Difference and intersection are computed with binary
+    search of one sorted array in the other, vectorized when numpy is installed.
+    """
+    def __init__(self, ids=()):
+        self.ids = array('q')
+        self.buffer = array('q')
+        self.update(ids)
+
+    @classmethod
+    def from_sorted(cls, ids: array):
+        """Wraps an already sorted array of unique IDs without copying"""
+        id_set = cls()
+        id_set.ids = ids
+        return id_set
+
+    def add(self, uid: int):
+        self.buffer.append(uid)
+        if len(self.buffer) > max(65536, len(self.ids)):
+            self.compact()
+
+    def update(self, ids):
+        if isinstance(ids, IdSet):
+            self.buffer.extend(ids.sorted())
+        elif isinstance(ids, array) and ids.typecode == 'q':
+            self.buffer.extend(ids)
+        else:
+            self.buffer.extend(array('q', ids))
+        if len(self.buffer) > max(65536, len(self.ids)):
+            self.compact()
+
+    def compact(self):
+        """Merges the buffer into the sorted array"""
+        if not self.buffer:
+            return
+        if numpy is not None:
+            merged = numpy.union1d(numpy.frombuffer(self.ids, dtype=numpy.int64),
+                                   numpy.frombuffer(self.buffer, dtype=numpy.int64))
+            self.ids = array('q', merged.astype(numpy.int64).tobytes())
+        else:
+            # linear merge of two sorted arrays: only the buffer becomes a list of ints, while it is sorted
+            merged, last = array('q'), None
+            for uid in heapq.merge(self.ids, array('q', sorted(self.buffer))):
+                if uid != last:
+                    merged.append(uid)
+                    last = uid
+            self.ids = merged
+        self.buffer = array('q')
+
+    def sorted(self) -> array:
+        """:returns: sorted array of the IDs (not a copy)"""
+        self.compact()
+        return self.ids
+
+    def __len__(self):
+        return len(self.sorted())
+
+    def __iter__(self):
+        return iter(self.sorted())
+
+    def __contains__(self, uid: int):
+        ids = self.sorted()
+        i = bisect_left(ids, uid)
+        return i < len(ids) and ids[i] == uid
+
+    def __repr__(self):
+        return f'IdSet({len(self)} ids)'
+
+    def select(self, other, keep: bool):
+        """IDs of this set which are in *other* (keep=True) or are not in it (keep=False)"""
+        other = other if isinstance(other, IdSet) else IdSet(other)
+        a, b = self.sorted(), other.sorted()
+        if numpy is not None:
+            a, b = numpy.frombuffer(a, dtype=numpy.int64), numpy.frombuffer(b, dtype=numpy.int64)
+            if len(b):
+                found = b[numpy.minimum(numpy.searchsorted(b, a), len(b) - 1)] == a
+            else:
+                found = numpy.zeros(len(a), dtype=bool)
+            return IdSet.from_sorted(array('q', a[found if keep else ~found].tobytes()))
+        return IdSet.from_sorted(array('q', (uid for uid in a if (uid in other) == keep)))
+
+    def __sub__(self, other):
+        return self.select(other, keep=False)
+
+    def __and__(self, other):
+        return self.select(other, keep=True)
+
+    def __or__(self, other):
+        union = IdSet(self)
+        union.update(other)
+        return union
+
+
+class MemberActivity:
+    """
+    Members of a group with a flag per member telling whether any activity of theirs was seen.
+
+    add()/update() mark users as active, so it can be filled like a set of active users (by CommentCrawler,
+    VkUserBot.get_liked); IDs of non-members are dropped right away. *remaining* is the amount of members
+    not proven active yet, it only shrinks
+    """
+    def __init__(self, members: IdSet):
+        self.ids = members.sorted()
+        self.seen = bytearray(len(self.ids))
+        self.remaining = len(self.ids)
+
+    def add(self, uid: int):
+        i = bisect_left(self.ids, uid)
+        if i < len(self.ids) and self.ids[i] == uid and not self.seen[i]:
+            self.seen[i] = 1
+            self.remaining -= 1
+
+    def update(self, ids):
+        ids = ids.sorted() if isinstance(ids, IdSet) else ids
+        if numpy is None or not len(self.ids):
+            for uid in ids:
+                self.add(uid)
+            return
+        members = numpy.frombuffer(self.ids, dtype=numpy.int64)
+        seen = numpy.frombuffer(self.seen, dtype=numpy.uint8)
+        batch = numpy.fromiter(ids, dtype=numpy.int64)
+        positions = numpy.minimum(numpy.searchsorted(members, batch), len(members) - 1)
+        positions = numpy.unique(positions[members[positions] == batch])
+        positions = positions[seen[positions] == 0]
+        seen[positions] = 1
+        self.remaining -= len(positions)
+
+    def unproven(self) -> IdSet:
+        """:returns: members with no activity seen"""
+        if numpy is not None:
+            members = numpy.frombuffer(self.ids, dtype=numpy.int64)
+            return IdSet.from_sorted(array('q', members[numpy.frombuffer(self.seen, dtype=numpy.uint8) == 0].tobytes()))
+        return IdSet.from_sorted(array('q', (uid for uid, seen in zip(self.ids, self.seen) if not seen)))
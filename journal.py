@@ -0,0 +1,88 @@
+import os
+import time
+
+from idset import IdSet
+
+
+class DeletionJournal:
+    """
+    Append-only text journal of a deletion run.
+
+    The first lines hold the plan (group and every UID to remove), then a line is appended for every
+    processed UID: 'done <uid>' or 'fail <uid> <reason>'. Re-opening the journal after a crash gives the
+    UIDs still pending, so the run can be resumed. A new plan archives the previous journal.
+    """
+    def __init__(self, path: str = 'delete_journal.txt', flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self.group_id = None
+        self.planned = IdSet()
+        self.done = IdSet()
+        self.failed = dict()  # uid -> reason
+        self.file = None
+        self.unflushed = 0
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(file=self.path, mode='r') as file:
+            for line in file:
+                record = line.split(maxsplit=2)
+                if len(record) < 2:
+                    continue  # line cut by a crash
+                if record[0] == 'group':
+                    self.group_id = int(record[1])
+                elif record[0] == 'plan':
+                    self.planned.add(int(record[1]))
+                elif record[0] == 'done':
+                    self.done.add(int(record[1]))
+                    self.failed.pop(int(record[1]), None)
+                elif record[0] == 'fail':
+                    self.failed[int(record[1])] = record[2].strip() if len(record) > 2 else ''
+
+    @property
+    def pending(self) -> IdSet:
+        """UIDs of the plan that were not processed yet (failed ones included, they can be retried)"""
+        return self.planned - self.done
+
+    def start(self, group_id: int, uids):
+        """Archives the previous journal and writes a new plan"""
+        if os.path.exists(self.path):
+            os.replace(self.path, f'{os.path.splitext(self.path)[0]}_{int(os.path.getmtime(self.path))}.txt')
+        self.group_id = group_id
+        self.planned = IdSet(uids)
+        self.done = IdSet()
+        self.failed = dict()
+        with open(file=self.path, mode='w') as file:
+            file.write(f'group {group_id}\n')
+            file.writelines(f'plan {uid}\n' for uid in self.planned)
+
+    def open(self):
+        self.file = open(file=self.path, mode='a')
+
+    def record(self, uid: int, ok: bool, reason: str = ''):
+        if ok:
+            self.done.add(uid)
+            self.failed.pop(uid, None)
+            self.file.write(f'done {uid}\n')
+        else:
+            self.failed[uid] = reason
+            self.file.write(f'fail {uid} {reason}\n')
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unflushed = 0
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def summary(self) -> str:
+        return f'{time.strftime("%d.%m.%Y %H:%M")}: {len(self.done)} / {len(self.planned)} removed, ' \
+               f'{len(self.failed)} failed'
@@ -1,14 +1,23 @@
+import json
 from datetime import datetime
 
 
 class Logger:
-    def __init__(self):
-        self.file = open(file='log.txt', mode='w+')
+    def __init__(self, path: str = 'log.txt', buffer_size: int = 64 * 1024):
+        self.file = open(file=path, mode='w+', buffering=buffer_size)
 
     def log(self, message: str):
         time = datetime.now()
         logstr = f'[{time.strftime("%H:%M:%S")}]: {message}\n'
         self.file.write(logstr)
 
+    def log_event(self, event: str, **fields):
+        """Writes a structured record: a JSON object on a single line"""
+        record = {'time': datetime.now().isoformat(timespec='seconds'), 'event': event, **fields}
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self.file.flush()
+
     def close(self):
         self.file.close()
@@ -1,9 +1,74 @@
+import queue
+import sys
+import threading
 import traceback
 
 import PySimpleGUI as sg
-from VkUserBot import VkUserBot, read_token
+from config import get_config
 from logger import Logger
-from vkbottle import VKAPIError
+from progress import OperationCancelled, Progress
+
+PROGRESS_EVENT = '-progress-'  # value: (element key, message)
+DONE_EVENT = '-done-'  # value: (job name, result, exception or None)
+
+
+class WindowProgress(Progress):
+    """Passes progress from the engine thread to the window as events. Safe to call from any thread"""
+    interval = 0.2
+    keys = {'search': 'group_name', 'delete': 'delete progress'}
+
+    def __init__(self, window: sg.Window):
+        self.window = window
+        self.cancel = threading.Event()  # set by the GUI thread to abort the operation
+
+    def update(self, event: str, message: str, done: int = None, total: int = None):
+        if not self.cancel.is_set():
+            self.window.write_event_value(PROGRESS_EVENT, (self.keys[event], message))
+
+    def cancelled(self) -> bool:
+        return self.cancel.is_set()
+
+
+class EngineThread(threading.Thread):
+    """
+    Runs blocking VkUserBot operations one at a time on a dedicated thread (and so on the persistent loop
+    of the bot), so the window never waits for the network. The result of every job comes back as DONE_EVENT
+    """
+    def __init__(self, window: sg.Window):
+        super().__init__(name='engine', daemon=True)
+        self.window = window
+        self.jobs = queue.Queue()
+        self.stopped = False
+
+    def submit(self, name: str, func, *args):
+        self.jobs.put((name, func, args))
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            name, func, args = job
+            try:
+                result, error = func(*args), None
+            except Exception as ex:
+                result, error = None, ex
+            if not self.stopped:
+                self.window.write_event_value(DONE_EVENT, (name, result, error))
+
+    def stop(self, timeout: float = 10.):
+        """Lets the current job finish (it should be cancelled beforehand) and ends the thread"""
+        self.stopped = True
+        self.jobs.put(None)
+        self.join(timeout)
+
+
+def is_vk_error(error: Exception, code: int = None) -> bool:
+    """Whether *error* is VKAPIError (of *code*). Does not import vkbottle, the engine thread does it in background"""
+    vkbottle = sys.modules.get('vkbottle')
+    if vkbottle is None:
+        return False
+    return isinstance(error, vkbottle.VKAPIError if code is None else vkbottle.VKAPIError[code])
 
 
 class GUIWindow:
@@ -14,10 +79,21 @@ class GUIWindow:
         self.logger = Logger()
         self.layout = self.layout_template()
         self.layout_name = 'main'
-        self.window = sg.Window(title="VKGhostCleaner", layout=self.layout, scaling=1.5, margins=(50, 10))
-        self.vk = VkUserBot(self.logger)  # bridge to vk API handler class
+        self.window = sg.Window(title="VKGhostCleaner", layout=self.layout, scaling=1.5, margins=(50, 10),
+                                finalize=True)
+        self.vk = None  # bridge to vk API handler class, created by the engine thread
+        self.engine = EngineThread(self.window)  # the only thread using self.vk
+        self.engine.start()
+        self.progress = None  # progress of the running job, None when idle
+        self.resume_group = None  # group of the unfinished deletion shown to the operator, resumed on the next press
+        self.start_job('init', self.init_job)  # heavy imports load while the window is already shown
         self.logger.log("GUI controller initialized")
 
+    def init_job(self, progress: Progress):
+        """Runs on the engine thread, so the bot (its loop, its SQLite caches) belongs to that thread"""
+        from VkUserBot import VkUserBot  # vkbottle takes seconds to import
+        self.vk = VkUserBot(self.logger)
+
     def start_event_loop(self):
         """Start event loop for PySimpleGUI"""
         self.logger.log("Staring the event loop...")
@@ -28,22 +104,28 @@ class GUIWindow:
                     break
                 else:
                     self.event_handler(event, values)
-            except VKAPIError as ex:
-                tb = traceback.format_exc()
-                sg.Print('Данная ошибка может быть связана с VK. Попробуйте ещё раз снова. '
-                         'Если ошибка повторится, свяжитесь с разрабочиком, отправив ему этот '
-                         f'текст: \n{tb}', keep_on_top=True, wait=True)
-
-                break
             except Exception as ex:
                 tb = traceback.format_exc()
-                sg.Print('Произошла неизвестная ошибка. Попробуйте перезапустить приложение.'
-                         ' Если ошибка повторится, свяжитесь с разработчиком, отправив ему этот '
-                         f'текст: \n{tb}', keep_on_top=True, wait=True)
+                if is_vk_error(ex):
+                    sg.Print('Данная ошибка может быть связана с VK. Попробуйте ещё раз снова. '
+                             'Если ошибка повторится, свяжитесь с разрабочиком, отправив ему этот '
+                             f'текст: \n{tb}', keep_on_top=True, wait=True)
+                else:
+                    sg.Print('Произошла неизвестная ошибка. Попробуйте перезапустить приложение.'
+                             ' Если ошибка повторится, свяжитесь с разработчиком, отправив ему этот '
+                             f'текст: \n{tb}', keep_on_top=True, wait=True)
                 break
+        self.stop_engine()
         self.logger.close()
         self.window.close()
 
+    def stop_engine(self):
+        """Cancels the running job, if any, closes connections of the bot and waits for the engine thread"""
+        if self.progress:
+            self.progress.cancel.set()
+        self.engine.submit('close', lambda: self.vk and self.vk.close_connection())
+        self.engine.stop()
+
     def event_handler(self, event, values):
         """
         :param event: event string provided by sg.window.read()
@@ -51,87 +133,174 @@ class GUIWindow:
 
         Handles GUI events from event loop
          """
-        vk = self.vk
         window = self.window
-        if event == "Поиск неактивных":
+        if event == PROGRESS_EVENT:
+            key, message = values[event]
+            window.find_element(key=key).update(message)
+        elif event == DONE_EVENT:
+            self.event_done(*values[event])
+        elif event in ("🔍", 'find', 'plan', 'Подтверждаю удаление!', 'plan delete') and self.progress:
+            warning = "⚠ Дождитесь завершения текущей операции"
+            key = 'delete progress' if event in ('Подтверждаю удаление!', 'plan delete') else 'group_name'
+            window.find_element(key=key).update(warning)
+        elif event == "Поиск неактивных":
             self.switch_layout('search')
         elif event == "🔍":
             self.logger.log(f"searching group {values.get('group input')}")
-            group_name = vk.find_group_sync(values.get('group input'))
-            group_name = f"Найдена группа: {group_name}" if group_name else "Группа не найдена"
-            window.find_element(key='group_name').update(group_name)
+            self.start_job('group', self.group_job, values.get('group input'))
         elif event == 'back' or event == 'back1':
             self.switch_layout('main')
         elif event == 'Удаление неактивных':
             self.switch_layout('delete')
         elif event == 'find':
             self.event_find(values)
+        elif event == 'plan':
+            self.event_plan(values)
         elif event == 'Подтверждаю удаление!':
             self.event_delete(values)
+        elif event == 'plan delete':
+            self.event_plan_delete(values)
         else:
             self.logger.log("Unknown event: " + event)
 
-    def event_find(self, values):
-        """Handles 'find' event"""
-        window = self.window
-        vk = self.vk
-        if vk.find_group_sync(values.get('group input')):
-            try:
-                posts_amount = int(values.get('post input'))
-                if posts_amount > 0:
-                    try:
-                        rps = int(values.get('rps input'))
-                        if rps in range(3, 101):
-                            inactive = self.vk.find_inactive(posts_amount, window, rps)
-                        else:
-                            inactive = self.vk.find_inactive(posts_amount, window)
-                        message = f"Выявлено неактивных: {len(inactive)}"
-                        window.find_element(key='group_name').update(message)
-                    except ValueError:
-                        inactive = self.vk.find_inactive(posts_amount, window)
-                        message = f"Выявлено неактивных: {len(inactive)}"
-                        window.find_element(key='group_name').update(message)
-                else:
-                    warning = "⚠ Во втором окне ввода должно быть положительное число постов!"
-                    window.find_element(key='group_name').update(warning)
-            except ValueError:
-                warning = "⚠ Во втором окне ввода должно быть положительное число постов!"
-                window.find_element(key='group_name').update(warning)
-            except VKAPIError[15]:
-                warning = "⚠ Недостаточно прав доступа токена!"
-                window.find_element(key='delete progress').update(warning)
-            except VKAPIError[6]:
-                warning = "⚠ Слишком высокий RPS!"
-                window.find_element(key='delete progress').update(warning)
+    def start_job(self, name: str, func, *args):
+        """Runs func(progress, *args) on the engine thread, its result comes back as DONE_EVENT"""
+        self.progress = WindowProgress(self.window)
+        self.engine.submit(name, func, self.progress, *args)
+
+    def event_done(self, name: str, result, error: Exception):
+        """Shows the result of a finished job. Unexpected errors are re-raised to the event loop"""
+        self.progress = None
+        if isinstance(error, OperationCancelled):
+            return
+        key = {'delete': 'delete progress', 'plan': 'plan text', 'plan delete': 'delete plan'}.get(name, 'group_name')
+        if is_vk_error(error, 15):
+            message = "⚠ Недостаточно прав доступа токена!"
+        elif is_vk_error(error, 6):
+            message = "⚠ Слишком высокий RPS!"
+        elif error:
+            raise error
+        elif name == 'init':
+            return
+        elif name == 'delete':
+            message, self.resume_group = result
         else:
-            warning = "⚠ Группа не найдена! Проверьте введённое значение"
-            window.find_element(key='group_name').update(warning)
+            message = result
+        self.window.find_element(key=key).update(message)
+
+    def group_job(self, progress: Progress, group: str) -> str:
+        """Runs on the engine thread. *progress* is not used, the lookup is a single request"""
+        group_name = self.vk.find_group_sync(group)
+        return f"Найдена группа: {group_name}" if group_name else "Группа не найдена"
+
+    def find_job(self, progress: Progress, group: str, posts_amount: int, rps: int, days: int,
+                 early_exit: bool) -> str:
+        """Runs on the engine thread"""
+        if not self.vk.find_group_sync(group):
+            return "⚠ Группа не найдена! Проверьте введённое значение"
+        inactive = self.vk.find_inactive(posts_amount, progress, rps, days=days, early_exit=early_exit)
+        return f"Выявлено неактивных: {len(inactive)}"
+
+    def plan_job(self, progress: Progress, group: str, posts_amount: int, rps: int, days: int) -> str:
+        """Runs on the engine thread. Makes only the cheap requests of VkUserBot.dry_run()"""
+        if not self.vk.find_group_sync(group):
+            return "⚠ Группа не найдена! Проверьте введённое значение"
+        return self.format_plan(self.vk.dry_run(posts_amount, rps, days))
+
+    def delete_plan_job(self, progress: Progress, rps: int) -> str:
+        """Runs on the engine thread. Plans deletion of the search result or of the unfinished journal"""
+        journal = self.vk.pending_journal() if self.vk.inactive is None else None
+        if self.vk.inactive is None and journal is None:
+            return "⚠ Сначала необходимо произвести поиск!"
+        return self.format_plan(self.vk.dry_run(None, rps, journal=journal))
+
+    def delete_job(self, progress: Progress, rps: int, resume_group: int) -> tuple:
+        """
+        Runs on the engine thread. Returns the message and the group of the unfinished deletion offered to resume.
+
+        Without a search in this session an unfinished deletion from the journal is continued, but only after
+        its group and amount of users were shown: *resume_group* is the group the operator has already seen
+        """
+        if self.vk.inactive is None:
+            journal = self.vk.pending_journal()
+            if journal is None:
+                return "⚠ Сначала необходимо произвести поиск!", None
+            if journal.group_id != resume_group:
+                name = self.vk.find_group_sync(journal.group_id, remember=False) or f"id{journal.group_id}"
+                return (f"Найдена незавершённая чистка группы {name}, осталось удалить: {len(journal.pending)}.\n"
+                        f"Нажмите ещё раз, чтобы продолжить её", journal.group_id)
+            self.vk.resume(journal)
+        elif not self.vk.inactive:
+            return "Неактивных не найдено, удалять некого", None
+        return f"Удалено: {self.vk.delete(progress, rps)}", None
+
+    @staticmethod
+    def format_plan(plan) -> str:
+        """Text of planner.Plan for the window. Called on the engine thread, where planner is already loaded"""
+        from planner import format_duration
+        names = {'scan': 'Поиск', 'report': 'Отчёт', 'delete': 'Удаление'}
+        lines = [f"Подписчиков: {plan.members}, постов: {plan.posts} (из кэша: {plan.posts_cached})"]
+        for name, phase in plan.phases.items():
+            lines.append(f"{names[name]}: {phase.requests} запросов ({phase.calls} вызовов), "
+                         f"~{format_duration(phase.seconds)}")
+        return '\n'.join(lines)
+
+    def read_search_input(self, values):
+        """Returns (posts amount, RPS, days) from the search screen or None after showing a warning"""
+        try:
+            posts_amount = int(values.get('post input'))
+        except ValueError:
+            posts_amount = 0
+        if posts_amount <= 0:
+            warning = "⚠ Во втором окне ввода должно быть положительное число постов!"
+            self.window.find_element(key='group_name').update(warning)
+            return None
+        return posts_amount, self.read_rps(values, 'rps input'), self.read_days(values)
+
+    def event_find(self, values):
+        """Handles 'find' event: checks the input and starts the search on the engine thread"""
+        search_input = self.read_search_input(values)
+        if search_input is None:
+            return
+        self.window.find_element(key='group_name').update("Производится поиск...")
+        self.start_job('find', self.find_job, values.get('group input'), *search_input,
+                       bool(values.get('early exit')))
+
+    def event_plan(self, values):
+        """Handles 'plan' event: estimates requests and time of the search and the deletion without making them"""
+        search_input = self.read_search_input(values)
+        if search_input is None:
+            return
+        self.window.find_element(key='plan text').update("Производится оценка...")
+        self.start_job('plan', self.plan_job, values.get('group input'), *search_input)
+
+    @staticmethod
+    def read_rps(values, key: str) -> int:
+        """Returns RPS from the *key* field if it is within 3..100, else the default 3"""
+        try:
+            rps = int(values.get(key))
+            return rps if rps in range(3, 101) else 3
+        except (TypeError, ValueError):
+            return 3
+
+    @staticmethod
+    def read_days(values):
+        """Returns positive amount of days from the 'days input' field or None to search by amount of posts only"""
+        try:
+            days = int(values.get('days input'))
+            return days if days > 0 else None
+        except (TypeError, ValueError):
+            return None
 
     def event_delete(self, values):
-        window = self.window
-        vk = self.vk
-        if vk.inactive:
-            try:
-                rps = int(values.get('rps input'))
-                if rps in range(3, 101):
-                    result = self.vk.delete(window, rps)
-                else:
-                    result = self.vk.delete(window)
-                message = f"Удалено: {result}"
-                window.find_element(key='delete progress').update(message)
-            except ValueError:
-                result = self.vk.delete(window)
-                message = f"Удалено: {result}"
-                window.find_element(key='delete progress').update(message)
-            except VKAPIError[15]:
-                warning = "⚠ Недостаточно прав доступа токена!"
-                window.find_element(key='delete progress').update(warning)
-            except VKAPIError[6]:
-                warning = "⚠ Слишком высокий RPS!"
-                window.find_element(key='delete progress').update(warning)
-        else:
-            warning = "⚠ Сначала необходимо произвести поиск!"
-            window.find_element(key='delete progress').update(warning)
+        """Handles deletion confirmation: starts the deletion (or resumes the journal) on the engine thread"""
+        self.window.find_element(key='delete progress').update("Чистка в процессе...")
+        self.start_job('delete', self.delete_job, self.read_rps(values, 'rps delete'), self.resume_group)
+
+    def event_plan_delete(self, values):
+        """Handles 'plan delete' event: estimates requests and time of the deletion without making it"""
+        self.window.find_element(key='delete plan').update("Производится оценка...")
+        self.start_job('plan delete', self.delete_plan_job, self.read_rps(values, 'rps delete'))
 
     def switch_layout(self, layout_name: str):
         """Show layout 'layout_name' (one of main, search, delete) and hide previous"""
@@ -161,7 +330,7 @@ class GUIWindow:
     @staticmethod
     def layout_template():
         """Return the layout template"""
-        token = read_token()
+        token = get_config().token
         token_text = "" if token else "\n⚠ файл token.txt пуст"
         header = [sg.Text(text=f'Главное Меню{token_text}', justification='center', pad=(0, (5, 30)),
                           font=('Arial', 16))]
@@ -178,7 +347,17 @@ class GUIWindow:
                          [sg.Text('Расширенные настройки:', pad=(0, (10, 10)))],
                          [sg.Text('RPS', tooltip='См. инструкцию. Не стоит менять, если не понятно, что это!'),
                           sg.InputText(default_text="3", size=(10, 2), key='rps input', pad=(0, (10, 10)))],
-                         [sg.Button('Поиск', key='find', size=(10, 1), pad=(0, (10, 10)))],
+                         [sg.Text('Дней', tooltip='Искать только среди постов за последние N дней. '
+                                                  'Число постов тогда ограничивает их максимальное количество'),
+                          sg.InputText(default_text="", size=(10, 2), key='days input', pad=(0, (10, 10)))],
+                         [sg.Checkbox('Быстрый поиск', key='early exit',
+                                      tooltip='Сначала загрузить подписчиков и остановить поиск, когда активность '
+                                              'перестанет находиться. Намного быстрее для активных групп, '
+                                              'но активность на старых постах может быть не учтена')],
+                         [sg.Button('Поиск', key='find', size=(10, 1), pad=(0, (10, 10))),
+                          sg.Button('Оценить', key='plan', size=(10, 1), pad=(0, (10, 10)),
+                                    tooltip='Оценить число запросов и время поиска и удаления, не выполняя их')],
+                         [sg.Text(key='plan text', size=(60, 4), font=('Arial', 10, 'normal'))],
                          [sg.Button('Назад', key='back', size=(10, 1), pad=(0, (10, 10)))]]
         warning_text = '⚠ Внимание! Данное действие невозможно будет отменить. Рекомендуется посмотреть файл inactive.xlsx, ' \
                        'чтобы убедится, что список примерно соотвествует ожиданиям и был составлен верно. Сохраните копию файла' \
@@ -189,7 +368,9 @@ class GUIWindow:
                          [sg.Text('Расширенные настройки:', pad=(0, (10, 10)))],
                          [sg.Text('RPS', tooltip='См. инструкцию. Не стоит менять, если не понятно, что это!'),
                           sg.InputText(default_text="3", size=(10, 2), key='rps delete', pad=(0, (10, 10)))],
-                         [sg.Text('', pad=(0, (15, 10)), key='delete progress')],
+                         [sg.Text('', pad=(0, (15, 10)), key='delete progress', size=(60, 2))],
+                         [sg.Button('Оценить время', key='plan delete'),
+                          sg.Text(key='delete plan', size=(60, 3), font=('Arial', 10, 'normal'))],
                          [sg.Button('Подтверждаю удаление!', pad=(0, (10, 30)))],
                          [sg.Button('Назад', key='back1', size=(10, 1))]]
         column_key = [[sg.Text(text='Отсутствует ключ активации!', justification='center', font=('Arial', 14))],
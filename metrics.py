@@ -0,0 +1,103 @@
+import json
+from bisect import bisect_left
+from collections import Counter
+
+# upper bounds of histogram buckets, seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+
+class Histogram:
+    """Fixed buckets histogram: recording a value is one bisect and two additions"""
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the *q* quantile"""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'sum': round(self.sum, 6),
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts))}
+
+
+class Metrics:
+    """
+    Request level metrics of MyAPI: calls per method, VK error codes, rate limiter queue wait,
+    network latency, response validation time and received bytes
+    """
+    timings = ('queue_wait', 'latency', 'validation')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()  # API method -> calls (methods inside execute included)
+        self.requests = Counter()  # HTTP requests per method ('execute' for batches)
+        self.errors = Counter()  # VK error code -> failed requests, plus failed calls inside execute
+        self.bytes_received = 0  # length of response texts
+        self.histograms = {name: Histogram() for name in self.timings}
+
+    def observe(self, name: str, seconds: float):
+        self.histograms[name].observe(seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': dict(self.calls),
+            'requests': dict(self.requests),
+            'errors': {str(code): count for code, count in self.errors.items()},
+            'bytes_received': self.bytes_received,
+            **{name: histogram.to_dict() for name, histogram in self.histograms.items()},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def to_prometheus(self, prefix: str = 'vkghostcleaner') -> str:
+        """Metrics in Prometheus text exposition format"""
+        lines = [f'# TYPE {prefix}_calls_total counter']
+        lines += [f'{prefix}_calls_total{{method="{method}"}} {count}' for method, count in self.calls.items()]
+        lines.append(f'# TYPE {prefix}_requests_total counter')
+        lines += [f'{prefix}_requests_total{{method="{method}"}} {count}' for method, count in self.requests.items()]
+        lines.append(f'# TYPE {prefix}_errors_total counter')
+        lines += [f'{prefix}_errors_total{{code="{code}"}} {count}' for code, count in self.errors.items()]
+        lines.append(f'# TYPE {prefix}_received_bytes_total counter')
+        lines.append(f'{prefix}_received_bytes_total {self.bytes_received}')
+        for name, histogram in self.histograms.items():
+            metric = f'{prefix}_{name}_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            cumulative = 0
+            for bound, count in zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum {histogram.sum}')
+            lines.append(f'{metric}_count {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path: str):
+        """Writes metrics to *path*: Prometheus text for .prom files, JSON otherwise"""
+        with open(file=path, mode='w') as file:
+            file.write(self.to_prometheus() if path.endswith('.prom') else self.to_json())
+
+    def summary(self) -> str:
+        parts = [f'{sum(self.requests.values())} requests for {sum(self.calls.values())} calls',
+                 f'{self.bytes_received / 1024:.0f} KiB received']
+        for name, histogram in self.histograms.items():
+            if histogram.count:
+                parts.append(f'{name} avg {histogram.sum / histogram.count * 1000:.0f} ms, '
+                             f'p95 <= {histogram.quantile(0.95) * 1000:.0f} ms')
+        if self.errors:
+            parts.append('errors ' + ', '.join(f'{code}: {count}' for code, count in self.errors.most_common()))
+        return '; '.join(parts)
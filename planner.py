@@ -0,0 +1,119 @@
+"""
+Dry-run planning: API calls, HTTP requests and ETA of the scan, the report and the deletion, estimated from
+counts VK gives away cheaply (amount of members, likes.count and comments.count of wall.get posts),
+and sizing of concurrency for a given RPS limit
+"""
+import math
+
+from batcher import EXECUTE_LIMIT
+from rls import WINDOW
+
+DEFAULT_LATENCY = 0.25  # seconds per request until measured
+MEMBERS_PAGE = 1000  # groups.getMembers
+POSTS_PAGE = 100  # wall.get
+LIKES_PAGE = 1000  # likes.getList
+COMMENTS_PAGE = 100  # wall.getComments
+USERS_PAGE = 1000  # users.get
+# comments per extra wall.getComments call for a thread too long for its inline preview (rough average)
+COMMENTS_PER_THREAD_CALL = 30
+
+
+def concurrency(rps: int, tokens: int = 1, latency: float = DEFAULT_LATENCY, batch: bool = True,
+                cap: int = 2000) -> int:
+    """
+    :param rps: RPS limit per token
+    :param tokens: amount of tokens
+    :param latency: seconds a request takes
+    :param batch: calls are packed into execute
+    :param cap: max result
+    :returns: calls to keep in flight so that the whole RPS budget is used
+
+    Every token slot of the rate limiter should find a full batch waiting, while the batches
+    of the previous *latency* seconds are still on their way
+    """
+    per_request = EXECUTE_LIMIT if batch else 1
+    return max(per_request, min(cap, math.ceil(2 * per_request * tokens * (rps * latency + 1))))
+
+
+class Phase:
+    def __init__(self, calls: int, requests: int, seconds: float):
+        self.calls = calls  # API methods called
+        self.requests = requests  # HTTP requests, execute batches counted once
+        self.seconds = seconds  # ETA
+
+
+class Plan:
+    """Estimate of the operations on a group at the given RPS limit and amount of tokens"""
+    def __init__(self, rps: int, tokens: int, batch: bool = True, latency: float = DEFAULT_LATENCY):
+        self.rps = rps
+        self.tokens = max(tokens, 1)
+        self.batch = batch
+        self.latency = latency
+        self.concurrency = concurrency(rps, self.tokens, latency, batch)
+        self.members = 0
+        self.posts = 0  # posts to scan
+        self.posts_cached = 0  # of them, unchanged since cached: not crawled again
+        self.likes = 0
+        self.comments = 0
+        self.inactive = 0  # users to put into the report and to delete
+        self.inactive_known = False  # False: nobody was scanned yet, all members are counted
+        self.requests = 0  # requests the estimate itself took
+        self.phases = dict()  # 'scan', 'report', 'delete' -> Phase
+
+    def add(self, name: str, calls: int):
+        """Adds phase *name* of *calls* batchable API calls"""
+        requests = math.ceil(calls / EXECUTE_LIMIT) if self.batch else calls
+        seconds = requests * WINDOW / (self.rps * self.tokens) + self.latency if requests else 0.
+        self.phases[name] = Phase(calls, requests, seconds)
+
+    def estimate(self, post_likes: list, post_comments: list, scan: bool = True):
+        """
+        :param post_likes: likes.count of every post to crawl
+        :param post_comments: comments.count of every post to crawl (replies included)
+        :param scan: plan the scan too, not only the report and the deletion
+
+        Fills the phases from the counts. Every post costs at least one likes.getList call, threads longer
+        than their inline previews are accounted for by the COMMENTS_PER_THREAD_CALL average
+        """
+        self.likes, self.comments = sum(post_likes), sum(post_comments)
+        if scan:
+            calls = 1 + math.ceil(self.posts / POSTS_PAGE) + math.ceil(self.members / MEMBERS_PAGE)
+            calls += sum(max(1, math.ceil(likes / LIKES_PAGE)) for likes in post_likes)
+            calls += sum(math.ceil(comments / COMMENTS_PAGE) for comments in post_comments)
+            calls += self.comments // COMMENTS_PER_THREAD_CALL
+            self.add('scan', calls)
+        if not self.inactive_known:
+            self.inactive = self.members
+        self.add('report', math.ceil(self.inactive / USERS_PAGE))
+        self.add('delete', self.inactive)
+
+    @property
+    def seconds(self) -> float:
+        return sum(phase.seconds for phase in self.phases.values())
+
+    def to_dict(self) -> dict:
+        return {
+            'rps': self.rps, 'tokens': self.tokens, 'batch': self.batch, 'latency': self.latency,
+            'concurrency': self.concurrency, 'members': self.members, 'posts': self.posts,
+            'posts_cached': self.posts_cached, 'likes': self.likes, 'comments': self.comments,
+            'inactive': self.inactive, 'inactive_known': self.inactive_known, 'requests': self.requests,
+            'phases': {name: vars(phase) for name, phase in self.phases.items()},
+        }
+
+    def summary(self) -> str:
+        lines = [f'{self.members} members, {self.posts} posts to scan ({self.posts_cached} of them cached), '
+                 f'{self.likes} likes, {self.comments} comments; {self.rps} RPS x {self.tokens} token(s), '
+                 f'latency {self.latency * 1000:.0f} ms, {self.concurrency} calls in flight']
+        for name, phase in self.phases.items():
+            users = ''
+            if name != 'scan':
+                users = f' for {"" if self.inactive_known else "up to "}{self.inactive} users'
+            lines.append(f'{name}: {phase.calls} calls in {phase.requests} requests{users}, '
+                         f'ETA {format_duration(phase.seconds)}')
+        return '\n'.join(lines)
+
+
+def format_duration(seconds: float) -> str:
+    """1:02:03 style duration"""
+    seconds = math.ceil(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
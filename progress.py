@@ -0,0 +1,35 @@
+import sys
+import time
+
+
+class OperationCancelled(Exception):
+    """Raised by VkUserBot operations once Progress.cancelled() returns True"""
+
+
+class Progress:
+    """Subscriber to progress of long VkUserBot operations. This base class ignores everything"""
+    interval = 1.  # seconds between updates
+
+    def update(self, event: str, message: str, done: int = None, total: int = None):
+        """
+        :param event: 'search' or 'delete'
+        :param message: human readable progress
+        :param done: requests made (search) or users processed (delete)
+        :param total: users to process (delete only)
+        """
+        pass
+
+    def cancelled(self) -> bool:
+        """Operation is aborted as soon as this returns True"""
+        return False
+
+
+class ConsoleProgress(Progress):
+    """Prints progress lines for headless runs"""
+    def __init__(self, stream=sys.stderr, interval: float = 5.):
+        self.stream = stream
+        self.interval = interval
+
+    def update(self, event: str, message: str, done: int = None, total: int = None):
+        self.stream.write(f'[{time.strftime("%H:%M:%S")}] {message}\n')
+        self.stream.flush()
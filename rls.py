@@ -1,41 +1,189 @@
 """
-Credit: https://stackoverflow.com/a/46255794/16775319
+Token bucket rate limiter with FIFO waiters, priority classes and adaptive rate
 """
 import asyncio
+import time
 from collections import deque
 
+PRIORITY_INTERACTIVE = 0  # single lookups the user is waiting for, e.g. groups.getById
+PRIORITY_BULK = 1  # scans and deletion
+# seconds in which at most rate_limit calls are let through. A bit over a second, so that network jitter
+# does not squeeze them into one second by the time they reach VK
+WINDOW = 1.05
+# auth failed, flood control, no permissions, rate limit reached: the token itself is unusable for now
+TOKEN_ERROR_CODES = (5, 9, 15, 29)
 
-class RateLimitingSemaphore:
-    def __init__(self, qps_limit, loop=None):
-        self.loop = loop or asyncio.get_event_loop()
-        self.qps_limit = qps_limit
 
-        # The number of calls that are queued up, waiting for their turn.
-        self.queued_calls = 0
+class TokenBucketScheduler:
+    def __init__(self, rate_limit, burst: int = None, min_rate: float = 1., window: float = WINDOW, clock=None,
+                 sleep=None):
+        """
+        :param rate_limit: max RPS
+        :param burst: max calls let through at once after idling (1 by default, calls are evenly spaced)
+        :param min_rate: rate never goes below this when slowing down
+        :param window: seconds in which at most rate_limit calls are let through
+        :param clock: time function (time.monotonic by default), replaceable with a simulated one
+        :param sleep: async sleep function (asyncio.sleep by default), replaceable with a simulated one
+        """
+        self.limit = rate_limit
+        self.rate = float(rate_limit)
+        self.min_rate = min_rate
+        self.capacity = burst or 1
+        self.tokens = float(self.capacity)
+        self.window = window
+        self.recent = deque()  # times of the calls of the last window, never more than rate_limit of them
+        self.clock = clock or time.monotonic
+        self.sleep = sleep or asyncio.sleep
+        self.updated = self.clock()
+        self.slowed_at = None
 
-        # The times of the last N executions, where N=qps_limit - this should allow us to calculate the QPS within the
-        # last ~ second. Note that this also allows us to schedule the first N executions immediately.
-        self.call_times = deque()
+        # Waiters are woken up one per token, in FIFO order within each priority class
+        self.waiters = tuple(deque() for _ in (PRIORITY_INTERACTIVE, PRIORITY_BULK))
+        self.queued_calls = 0
+        self.pump_task = None
 
     async def __aenter__(self):
-        self.queued_calls += 1
-        while True:
-            cur_rate = 0
-            if len(self.call_times) == self.qps_limit:
-                if self.loop.time() - self.call_times[0] != 0:
-                    cur_rate = len(self.call_times) / (self.loop.time() - self.call_times[0])
-                else:
-                    cur_rate = len(self.call_times) / (self.loop.time() + 0.000001 - self.call_times[0])
-            if cur_rate < self.qps_limit:
-                break
-            interval = 1. / self.qps_limit
-            elapsed_time = self.loop.time() - self.call_times[-1]
-            await asyncio.sleep(self.queued_calls * interval - elapsed_time)
-        self.queued_calls -= 1
-
-        if len(self.call_times) == self.qps_limit:
-            self.call_times.popleft()
-        self.call_times.append(self.loop.time())
+        await self.acquire()
 
     async def __aexit__(self, exc_type, exc, tb):
-        pass
\ No newline at end of file
+        pass
+
+    async def acquire(self, priority: int = PRIORITY_BULK):
+        """Waits for a token. Calls of higher priority (lower value) are let through first"""
+        if not self.queued_calls and self.take():
+            return
+        future = asyncio.get_event_loop().create_future()
+        self.waiters[priority].append(future)
+        self.queued_calls += 1
+        if self.pump_task is None or self.pump_task.done():
+            self.pump_task = asyncio.create_task(self.pump())
+        await future
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        self.refill()
+        # float error of refill must not make us sleep for nothing
+        if self.tokens >= 1 - 1e-9 and not self.window_wait():
+            self.tokens -= 1
+            self.recent.append(self.updated)
+            return True
+        return False
+
+    def window_wait(self) -> float:
+        """Seconds until one more call fits into the last window without going over rate_limit, 0 if it fits now"""
+        while self.recent and self.updated - self.recent[0] >= self.window - 1e-9:
+            self.recent.popleft()
+        return self.recent[0] + self.window - self.updated if len(self.recent) >= self.limit else 0.
+
+    async def pump(self):
+        """Hands out tokens to the waiters as they become available, sleeping exactly until the next one"""
+        while self.queued_calls:
+            if not self.take():
+                await self.sleep(max((1 - self.tokens) / self.rate, self.window_wait()))
+                continue
+            future = self.pop_waiter()
+            if future.cancelled():
+                self.tokens += 1  # nobody to use it
+                self.recent.pop()
+            else:
+                future.set_result(None)
+
+    def pop_waiter(self) -> asyncio.Future:
+        for queue in self.waiters:
+            if queue:
+                self.queued_calls -= 1
+                return queue.popleft()
+
+    def slow_down(self, cooldown: float = 1.):
+        """
+        :param cooldown: min seconds between two slowdowns
+
+        Halves the rate (on VK error 6). Errors of calls that were already in flight are
+        ignored within *cooldown*, so one burst of errors halves the rate only once
+        """
+        now = self.clock()
+        if self.slowed_at is not None and now - self.slowed_at < cooldown:
+            return
+        self.refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.)
+        self.slowed_at = now
+
+    def speed_up(self):
+        """Raises the rate back towards the limit a bit after every successful call"""
+        if self.rate < self.limit:
+            self.refill()
+            self.rate = min(self.limit, self.rate + self.limit / 200)
+
+
+class TokenDropped(Exception):
+    """Request failed because its token was taken out of rotation, it can be repeated with another token"""
+
+
+class TokenSlot:
+    """Access token with its own rate limiter"""
+    def __init__(self, token: str, sema: TokenBucketScheduler):
+        self.token = token
+        self.sema = sema
+
+    @property
+    def load(self) -> float:
+        """Approximate seconds a new call would wait for this token"""
+        return (self.sema.queued_calls + 1) / self.sema.rate
+
+
+class TokenPool:
+    """Several access tokens, each limited to its own RPS. Calls go to the least loaded token"""
+    def __init__(self, tokens: list, rate_limit, metrics=None):
+        """
+        :param tokens: access tokens
+        :param rate_limit: max RPS of every token
+        :param metrics: metrics.Metrics to record time spent waiting for tokens to
+        """
+        self.limit = rate_limit
+        self.slots = [TokenSlot(token, TokenBucketScheduler(rate_limit)) for token in tokens]
+        self.dropped = list()
+        self.metrics = metrics
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def queued_calls(self) -> int:
+        return sum(slot.sema.queued_calls for slot in self.slots)
+
+    async def acquire(self, priority: int = PRIORITY_BULK) -> TokenSlot:
+        """Waits for a token of the least loaded slot and returns the slot. Raises LookupError if the pool is empty"""
+        if not self.slots:
+            raise LookupError('no access tokens left in the pool')
+        slot = min(self.slots, key=lambda s: s.load)
+        start = time.perf_counter()
+        await slot.sema.acquire(priority)
+        if self.metrics:
+            self.metrics.observe('queue_wait', time.perf_counter() - start)
+        return slot
+
+    def drop(self, slot: TokenSlot) -> bool:
+        """
+        :param slot: slot of the token that failed
+        :return: True if the call can be repeated with another token
+
+        Takes token out of rotation (no permissions, flood control). The last token is never dropped:
+        its calls fail with their own errors instead, and the next calls still have a token to try
+        """
+        if slot not in self.slots:
+            return True  # already dropped by another request
+        if len(self.slots) == 1:
+            return False
+        self.slots.remove(slot)
+        self.dropped.append(slot)
+        return True
+
+    def set_limit(self, rate_limit):
+        self.limit = rate_limit
+        for slot in self.slots:
+            slot.sema = TokenBucketScheduler(rate_limit)
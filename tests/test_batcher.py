@@ -0,0 +1,138 @@
+"""ExecuteBatcher and MyAPI against fake_vk.FakeVkServer running in the same event loop"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('vkbottle')
+
+from vkbottle import VKAPIError  # noqa: E402
+
+from batcher import EXECUTE_LIMIT, ExecuteBatcher  # noqa: E402
+from fake_vk import FakeGroup, FakeVkServer  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from rls import TokenDropped, TokenPool  # noqa: E402
+from VkUserBot import MyAPI  # noqa: E402
+
+
+def run_with_server(test, group: FakeGroup = None, **server_args):
+    """Runs *test(server, group)* with a fake VK server serving *group* on a free local port"""
+    group = group or FakeGroup(members=300, posts=10)
+
+    async def main():
+        server = await FakeVkServer([group], latency=0.001, jitter=0., **server_args).start()
+        try:
+            return await test(server, group)
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+def make_api(server: FakeVkServer, tokens=('token',), rps: int = 100) -> MyAPI:
+    return MyAPI(list(tokens), rps, api_url=server.url)
+
+
+class StubAPI:
+    """What ExecuteBatcher.resolve() uses of MyAPI"""
+    def __init__(self, tokens: list):
+        self.metrics = Metrics()
+        self.pool = TokenPool(tokens, 3, self.metrics)
+
+
+def make_batch(loop, size: int) -> list:
+    return [('users.get', {'user_ids': str(i)}, loop.create_future()) for i in range(size)]
+
+
+def test_calls_are_packed_into_execute():
+    async def test(server, group):
+        api = make_api(server)
+        try:
+            pages = await asyncio.gather(*[api.groups.get_members(group_id=group.id, offset=offset, count=10)
+                                           for offset in range(0, 300, 10)])
+        finally:
+            await api.http_client.close()
+        assert sorted(uid for page in pages for uid in page.items) == sorted(group.members)
+        assert server.requests['execute'] == -(-30 // EXECUTE_LIMIT)
+        assert server.calls['groups.getMembers'] == 30
+
+    run_with_server(test)
+
+
+def test_resolve_keeps_error_order_with_cancelled_callers():
+    async def test():
+        api = StubAPI(['token'])
+        batcher = ExecuteBatcher(api)
+        batch = make_batch(asyncio.get_running_loop(), 5)
+        batch[0][2].cancel()  # its error must still be consumed
+        batch[3][2].cancel()
+        result = {'response': [False, [1], False, False, [4]],
+                  'execute_errors': [{'error_code': 100, 'error_msg': 'first'},
+                                     {'error_code': 18, 'error_msg': 'second'},
+                                     {'error_code': 30, 'error_msg': 'third'}]}
+        batcher.resolve(batch, result, api.pool.slots[0])
+        futures = [call[2] for call in batch]
+        assert futures[1].result() == {'response': [1]}
+        assert isinstance(futures[2].exception(), VKAPIError[18])
+        assert futures[4].result() == {'response': [4]}
+        assert api.metrics.errors == {100: 1, 18: 1, 30: 1}  # failures of gone callers are counted too
+
+    asyncio.run(test())
+
+
+def test_resolve_drops_token_only_when_every_call_failed_with_it():
+    async def test():
+        api = StubAPI(['first', 'second'])
+        batcher = ExecuteBatcher(api)
+        slot = api.pool.slots[0]
+        batch = make_batch(asyncio.get_running_loop(), 3)
+        result = {'response': [False, [1], False],
+                  'execute_errors': [{'error_code': 15, 'error_msg': 'Access denied'},
+                                     {'error_code': 100, 'error_msg': 'Invalid parameter'}]}
+        batcher.resolve(batch, result, slot)
+        assert isinstance(batch[0][2].exception(), VKAPIError[15])  # the token works for other calls
+        assert isinstance(batch[2][2].exception(), VKAPIError[100])
+        assert len(api.pool) == 2
+
+        batch = make_batch(asyncio.get_running_loop(), 2)
+        batcher.resolve(batch, {'response': [False, False], 'execute_errors': [{'error_code': 15}] * 2}, slot)
+        assert all(isinstance(call[2].exception(), TokenDropped) for call in batch)
+        assert api.pool.dropped == [slot] and len(api.pool) == 1
+
+        batch = make_batch(asyncio.get_running_loop(), 1)
+        last = api.pool.slots[0]
+        batcher.resolve(batch, {'response': [False], 'execute_errors': [{'error_code': 15}]}, last)
+        assert isinstance(batch[0][2].exception(), VKAPIError[15])  # nothing to repeat with
+        assert api.pool.slots == [last]  # and the last token is kept for the next calls
+
+    asyncio.run(test())
+
+
+def test_readonly_token_is_dropped_and_calls_are_repeated():
+    async def test(server, group):
+        api = make_api(server, tokens=('readonly', 'admin'))
+        users = group.members[:60]
+        try:
+            results = await asyncio.gather(*[api.groups.remove_user(group_id=group.id, user_id=uid)
+                                             for uid in users])
+        finally:
+            await api.http_client.close()
+        assert all(results)
+        assert group.removed == set(users)
+        assert [slot.token for slot in api.pool.slots] == ['admin']
+
+    run_with_server(test, readonly_tokens=('readonly',))
+
+
+def test_failed_execute_is_counted_once():
+    async def test(server, group):
+        api = make_api(server)
+        api.retries = 0
+        try:
+            results = await asyncio.gather(*[api.groups.get_members(group_id=group.id, offset=offset, count=10)
+                                             for offset in range(0, 100, 10)], return_exceptions=True)
+        finally:
+            await api.http_client.close()
+        assert all(isinstance(result, VKAPIError[6]) for result in results)
+        assert api.metrics.errors[6] == api.requests < len(results)  # once per request, not per call
+
+    run_with_server(test, error_rate=1.)
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+import idset
+from idset import IdSet, MemberActivity
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@pytest.fixture(params=['numpy', 'pure'])
+def backend(request, monkeypatch):
+    """Runs the test with the vectorized and with the pure Python implementation"""
+    if request.param == 'numpy':
+        if numpy is None:
+            pytest.skip('numpy is not installed')
+        monkeypatch.setattr(idset, 'numpy', numpy)
+    else:
+        monkeypatch.setattr(idset, 'numpy', None)
+    return request.param
+
+
+def random_ids(rng: random.Random, amount: int) -> list:
+    return [rng.randrange(1, 5000) for _ in range(amount)]
+
+
+def test_set_algebra_matches_python_sets(backend):
+    rng = random.Random(1)
+    for _ in range(20):
+        a, b = random_ids(rng, rng.randrange(0, 500)), random_ids(rng, rng.randrange(0, 500))
+        x, y = IdSet(a), IdSet(b)
+        assert list(x) == sorted(set(a))
+        assert len(x) == len(set(a))
+        assert list(x - y) == sorted(set(a) - set(b))
+        assert list(x & y) == sorted(set(a) & set(b))
+        assert list(x | y) == sorted(set(a) | set(b))
+        assert list(x - b) == sorted(set(a) - set(b))  # any iterable as the other operand
+        assert all((uid in x) == (uid in set(a)) for uid in range(0, 5001, 7))
+
+
+def test_incremental_additions(backend):
+    ids = IdSet([5, 3])
+    ids.add(4)
+    ids.add(3)
+    ids.update(IdSet([1, 9]))
+    ids.update([2, 2])
+    assert list(ids) == [1, 2, 3, 4, 5, 9]
+    assert 9 in ids and 6 not in ids
+    assert list(IdSet() - ids) == [] and list(ids - IdSet()) == [1, 2, 3, 4, 5, 9]
+
+
+def test_member_activity(backend):
+    members = IdSet(range(10, 20))
+    activity = MemberActivity(members)
+    activity.add(12)
+    activity.add(12)  # counted once
+    activity.add(99)  # not a member
+    activity.update([13, 14, 14, 5, 1000])
+    activity.update(IdSet([19, 14]))
+    assert activity.remaining == 6
+    assert list(activity.unproven()) == [10, 11, 15, 16, 17, 18]
+    assert list(members - activity.unproven()) == [12, 13, 14, 19]
+
+
+def test_member_activity_of_empty_group(backend):
+    activity = MemberActivity(IdSet())
+    activity.update([1, 2])
+    assert activity.remaining == 0 and list(activity.unproven()) == []
+
+
+def test_compaction_of_big_buffers(backend):
+    rng = random.Random(2)
+    ids, expected = IdSet(), set()
+    for _ in range(300):  # buffer goes over the compaction threshold several times
+        page = [rng.randrange(1, 200000) for _ in range(1000)]
+        ids.update(page)
+        expected.update(page)
+    assert len(ids.buffer) < len(ids.ids)  # compacted on the way, not only at the end
+    assert list(ids) == sorted(expected)
@@ -0,0 +1,53 @@
+import os
+
+from journal import DeletionJournal
+
+
+def test_resume_after_restart(tmp_path):
+    path = str(tmp_path / 'delete_journal.txt')
+    journal = DeletionJournal(path, flush_every=2)
+    journal.start(42, [3, 1, 2, 5])
+    journal.open()
+    journal.record(1, True)
+    journal.record(2, False, 'error 15')
+    journal.close()
+
+    resumed = DeletionJournal(path)
+    assert resumed.group_id == 42
+    assert list(resumed.planned) == [1, 2, 3, 5]
+    assert list(resumed.done) == [1]
+    assert resumed.failed == {2: 'error 15'}
+    assert list(resumed.pending) == [2, 3, 5]  # failed ones are retried
+
+
+def test_retried_failure_is_done(tmp_path):
+    path = str(tmp_path / 'delete_journal.txt')
+    journal = DeletionJournal(path)
+    journal.start(1, [7, 8])
+    journal.open()
+    journal.record(7, False, 'error 6')
+    journal.record(7, True)
+    journal.close()
+    resumed = DeletionJournal(path)
+    assert resumed.failed == {} and list(resumed.pending) == [8]
+
+
+def test_line_cut_by_crash_is_ignored(tmp_path):
+    path = tmp_path / 'delete_journal.txt'
+    path.write_text('group 1\nplan 10\nplan 11\ndone 10\ndone')
+    journal = DeletionJournal(str(path))
+    assert list(journal.pending) == [11]
+
+
+def test_new_plan_archives_previous_journal(tmp_path):
+    path = str(tmp_path / 'delete_journal.txt')
+    DeletionJournal(path).start(1, [1, 2])
+    journal = DeletionJournal(path)
+    journal.start(2, [3])
+    assert len(os.listdir(tmp_path)) == 2
+    assert DeletionJournal(path).group_id == 2 and list(DeletionJournal(path).pending) == [3]
+
+
+def test_nothing_pending_without_journal(tmp_path):
+    journal = DeletionJournal(str(tmp_path / 'delete_journal.txt'))
+    assert journal.group_id is None and not journal.pending
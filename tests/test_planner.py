@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip('vkbottle')  # planner sizes batches of batcher
+
+from planner import Plan, concurrency, format_duration  # noqa: E402
+from rls import WINDOW  # noqa: E402
+
+
+def test_estimate_of_all_phases():
+    plan = Plan(rps=3, tokens=1)
+    plan.members, plan.posts = 2500, 150
+    plan.estimate(post_likes=[0, 1500, 10], post_comments=[0, 250, 60])
+    # getById + 2 pages of the wall + 3 pages of members, 4 pages of likes and 4 of comments, 310 // 30 threads
+    assert plan.phases['scan'].calls == 1 + 2 + 3 + 4 + 4 + 10
+    assert plan.phases['scan'].requests == 1
+    assert plan.inactive == 2500  # nobody scanned yet: every member may go
+    assert plan.phases['report'].calls == 3
+    delete = plan.phases['delete']
+    assert (delete.calls, delete.requests) == (2500, 100)
+    assert delete.seconds == pytest.approx(100 * WINDOW / 3 + plan.latency)
+    assert plan.seconds == pytest.approx(sum(phase.seconds for phase in plan.phases.values()))
+
+
+def test_estimate_of_known_inactive_users_without_scan():
+    plan = Plan(rps=10, tokens=4, batch=False)
+    plan.members, plan.inactive, plan.inactive_known = 2500, 400, True
+    plan.estimate([], [], scan=False)
+    assert set(plan.phases) == {'report', 'delete'}
+    delete = plan.phases['delete']
+    assert delete.requests == 400  # not packed into execute
+    assert delete.seconds == pytest.approx(400 * WINDOW / 40 + plan.latency)
+    assert 'for 400 users' in plan.summary() and plan.to_dict()['phases']['delete']['calls'] == 400
+
+
+def test_concurrency_fills_the_rps_budget():
+    assert concurrency(3) == 88  # 2 batches of 25 per slot, 1.75 slots per token in flight
+    assert concurrency(3, batch=False) == 4
+    assert concurrency(100, tokens=10) == 2000  # capped
+    assert concurrency(3, tokens=2) > concurrency(3)
+
+
+def test_format_duration():
+    assert format_duration(0) == '0:00:00'
+    assert format_duration(3722.1) == '1:02:03'
@@ -0,0 +1,74 @@
+"""TokenBucketScheduler on the simulated clock of bench_rls: no real sleeping"""
+import asyncio
+import bisect
+
+from bench_rls import SimulatedClock
+from rls import PRIORITY_INTERACTIVE, TokenBucketScheduler
+
+
+def make_scheduler(rps: int, **kwargs):
+    clock = SimulatedClock()
+    return TokenBucketScheduler(rps, clock=clock.time, sleep=clock.sleep, **kwargs), clock
+
+
+async def granted_times(scheduler: TokenBucketScheduler, clock: SimulatedClock, calls: int) -> list:
+    """Times at which *calls* bulk calls queued at once were let through"""
+    granted = list()
+    take = scheduler.take
+
+    def timed_take() -> bool:
+        if take():
+            granted.append(clock.now)
+            return True
+        return False
+
+    scheduler.take = timed_take
+    await asyncio.gather(*[scheduler.acquire() for _ in range(calls)])
+    return granted
+
+
+def test_never_more_than_rate_limit_calls_in_a_second():
+    async def test():
+        for rps, burst in ((3, None), (20, None), (3, 10)):
+            scheduler, clock = make_scheduler(rps, burst=burst)
+            granted = await granted_times(scheduler, clock, 200)
+            busiest = max(bisect.bisect_left(granted, t + 1.) - i for i, t in enumerate(granted))
+            assert busiest <= rps
+            assert clock.now >= (len(granted) - rps) / rps  # and the limit is used, not undershot by far
+            assert clock.now <= len(granted) / rps * scheduler.window
+
+    asyncio.run(test())
+
+
+def test_interactive_call_goes_before_bulk_backlog():
+    async def test():
+        scheduler, clock = make_scheduler(3)
+        order = list()
+
+        async def call(name, priority):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        bulk = [asyncio.create_task(call('bulk', 1)) for _ in range(30)]
+        await asyncio.sleep(0)
+        await call('interactive', PRIORITY_INTERACTIVE)
+        await asyncio.gather(*bulk)
+        assert order.index('interactive') <= 2  # behind at most the calls already let through
+        assert len(order) == 31
+
+    asyncio.run(test())
+
+
+def test_slow_down_halves_rate_and_speed_up_restores_it():
+    scheduler, clock = make_scheduler(8, min_rate=1.)
+    scheduler.slow_down()
+    assert scheduler.rate == 4
+    scheduler.slow_down()  # errors of calls already in flight
+    assert scheduler.rate == 4
+    for _ in range(3):
+        clock.now += 1.
+        scheduler.slow_down()
+    assert scheduler.rate == 1  # never below min_rate
+    for _ in range(1000):
+        scheduler.speed_up()
+    assert scheduler.rate == 8  # never above the limit
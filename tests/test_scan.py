@@ -0,0 +1,193 @@
+"""VkUserBot search and deletion end to end against fake_vk.FakeVkServer on the loop of the bot"""
+import csv
+import os
+
+import pytest
+
+pytest.importorskip('vkbottle')
+
+import ExcelWriter  # noqa: E402
+from fake_vk import FakeGroup, FakeVkServer  # noqa: E402
+from idset import IdSet  # noqa: E402
+from journal import DeletionJournal  # noqa: E402
+from logger import Logger  # noqa: E402
+from progress import Progress  # noqa: E402
+from VkUserBot import MyAPI, VkUserBot  # noqa: E402
+
+
+@pytest.fixture
+def make_bot(tmp_path, monkeypatch):
+    """Factory of bots of the first of the given fake groups, with its ground truth as bot.fake_group"""
+    monkeypatch.chdir(tmp_path)  # caches, journal and log
+    logger = Logger(str(tmp_path / 'log.txt'))
+    started = list()
+
+    def make(*groups: FakeGroup, tokens=('token',), **server_args) -> VkUserBot:
+        vk = VkUserBot(logger)
+        vk.fake_group = groups[0]
+        server = vk.run(FakeVkServer(list(groups), latency=0.001, jitter=0., **server_args).start())
+        vk.api = MyAPI(list(tokens), 100, api_url=server.url, http_client=vk.http)
+        vk.group = {'id': vk.fake_group.id}
+        started.append((vk, server))
+        return vk
+
+    yield make
+    for vk, server in started:
+        vk.run(server.stop())
+        vk.close_connection()
+    logger.close()
+
+
+@pytest.fixture
+def bot(make_bot):
+    """Bot of a fake group of 500 members and 30 posts"""
+    return make_bot(FakeGroup(members=500, posts=30))
+
+
+def test_members_are_paged_past_first_page(make_bot):
+    bot = make_bot(FakeGroup(members=2500, posts=1))
+    assert list(bot.run(bot.get_subscribers())) == bot.fake_group.members
+    assert bot.api.metrics.calls['groups.getMembers'] == 3
+
+
+def test_pages_are_streamed(make_bot):
+    bot = make_bot(FakeGroup(members=2500, posts=1))
+
+    async def pages():
+        return [len(page) async for page in bot.iter_subscribers(page_size=1000, window=2)]
+
+    assert sorted(bot.run(pages())) == [500, 1000, 1000]
+
+
+def test_likers_are_paged_past_first_page(make_bot):
+    bot = make_bot(FakeGroup(members=3000, posts=2, likes_per_post=2000, active_share=1., outsiders_share=0.))
+    likers = [post['likers'] for post in bot.fake_group.posts]
+    assert min(map(len, likers)) > 1000
+
+    async def liked():
+        active = IdSet()
+        counts = [await bot.get_liked(post, active) for post in await bot.get_posts(2)]
+        return active, counts
+
+    active, counts = bot.run(liked())
+    assert sorted(counts) == sorted(map(len, likers))
+    assert set(active) == set().union(*likers)
+    assert bot.api.metrics.calls['likes.getList'] == sum(-(-len(post) // 1000) for post in likers)
+
+
+@pytest.mark.parametrize('early_exit', [False, True])
+def test_search_finds_ground_truth(bot, early_exit):
+    search = bot.resolve_inactive if early_exit else bot.gather_inactive
+    inactive = bot.run(search(Progress(), 30))
+    assert set(inactive) == bot.fake_group.expected_inactive(30)
+
+
+def test_manager_does_not_take_away_the_only_token(make_bot):
+    bot = make_bot(FakeGroup(members=100, posts=1, managers=(1000042,)))
+    uids = IdSet(bot.fake_group.members)
+    bot.journal = DeletionJournal()
+    bot.journal.start(bot.group['id'], uids)
+    bot.run(bot.delete_subs(uids, Progress()))
+    assert bot.fake_group.removed == set(uids) - {1000042}
+    assert bot.journal.failed == {1000042: 'error 15'}
+    assert len(bot.api.pool) == 1
+    assert bot.find_group_sync(bot.group['id']) == bot.fake_group.name
+
+
+def test_rescan_reuses_cache(bot):
+    first = set(bot.run(bot.gather_inactive(Progress(), 30)))
+    bot.api.reset_stats()
+    assert set(bot.run(bot.gather_inactive(Progress(), 30))) == first
+    assert 'likes.getList' not in bot.api.metrics.calls
+
+
+def test_delete_is_journaled_and_resumable(bot):
+    inactive = bot.run(bot.gather_inactive(Progress(), 30))
+    bot.inactive = inactive
+    uids = list(inactive)
+    bot.journal = DeletionJournal()
+    bot.journal.start(bot.group['id'], uids)
+    bot.run(bot.delete_subs(uids[:10], Progress()))
+    assert bot.fake_group.removed == set(uids[:10])
+
+    journal = bot.pending_journal()
+    assert journal.group_id == bot.group['id'] and list(journal.pending) == sorted(uids[10:])
+    assert bot.resume(journal) == len(uids) - 10
+    bot.delete(Progress(), 100)
+    assert bot.fake_group.removed == set(uids) and bot.pending_journal() is None
+
+
+def test_report_is_written_from_any_directory(bot):
+    pytest.importorskip('openpyxl')
+    bot.find_inactive(30, rps=100, report='xlsx')  # the working directory is a temporary one, not the repository
+    assert os.path.exists('inactive.xlsx') and bot.failed_reports == []
+
+
+def test_report_failure_is_remembered(bot, monkeypatch):
+    def fail(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr('ExcelWriter.read_template', lambda: (['ID'], {}))
+    monkeypatch.setitem(ExcelWriter.WRITERS, 'csv', fail)
+    bot.find_inactive(30, rps=100, report='csv')
+    assert bot.failed_reports == ['inactive.csv']
+
+
+def test_several_groups_and_cross_group_report(make_bot):
+    pytest.importorskip('openpyxl')  # columns come from the template
+    first, second = FakeGroup(1, members=400, posts=20, seed=1), FakeGroup(2, members=600, posts=20, seed=2)
+    bot = make_bot(first, second)
+    expected = {1: first.expected_inactive(20), 2: second.expected_inactive(20)}
+    bots, cross = bot.find_inactive_groups(['1', '2'], 20, rps=100, report='csv')
+    assert {gid: set(found.inactive) for gid, found in bots.items()} == expected
+    assert cross == {uid: [1, 2] for uid in expected[1] & expected[2]}
+    with open('inactive_several.csv', encoding='utf-8-sig') as file:
+        rows = list(csv.reader(file))
+    assert rows[0][-1] == ExcelWriter.GROUPS_COLUMN and len(rows) == len(cross) + 1
+    assert rows[1][-1] == f'{first.name} (1), {second.name} (2)'
+    assert os.path.exists('inactive_1.csv') and os.path.exists('inactive_2.csv')
+
+    # members of the first group are members of the second one as well
+    active = (set(first.members) - expected[1]) | (set(second.members) - expected[2])
+    bots, cross = bot.find_inactive_groups(['1', '2'], 20, rps=100, exclude_active=True,
+                                         report=None)
+    assert {gid: set(found.inactive) for gid, found in bots.items()} == {1: expected[1] - active,
+                                                                        2: expected[2] - active}
+
+
+@pytest.mark.parametrize('amount', [100, 5])
+def test_days_cut_off_skips_old_pinned_post(make_bot, amount):
+    # a post every 6 hours: 12 posts of the last 3 days, and an old one pinned on top of them
+    bot = make_bot(FakeGroup(members=500, posts=60, pinned=5))
+    inactive = bot.run(bot.gather_inactive(Progress(), amount, days=3))
+    assert set(inactive) == bot.fake_group.expected_inactive(amount, days=3)
+    assert set(inactive) != bot.fake_group.expected_inactive(min(amount, 12) + 1)  # the same posts and the pinned one
+
+
+def test_days_cut_off_stops_paging_the_wall(make_bot):
+    bot = make_bot(FakeGroup(members=100, posts=60, pinned=5))
+
+    async def posts():
+        return [post.id async for page in bot.iter_posts_since(days=3, page_size=5) for post in page]
+
+    assert bot.run(posts()) == list(range(60, 48, -1))
+    assert bot.api.metrics.calls['wall.get'] == 3  # the pinned post does not stop it, the 13th recent one does
+
+
+def test_early_exit_report_after_scan_and_dry_run(bot):
+    pytest.importorskip('openpyxl')  # columns come from the template
+    bot.run(bot.gather_inactive(Progress(), 30))  # fills the activity cache
+    bot.dry_run(30, rps=100)
+    inactive = bot.find_inactive(30, rps=100, report='csv', early_exit=True)
+    assert bot.failed_reports == []  # the profile cache was not locked out by the activity cache
+    with open('inactive.csv', encoding='utf-8-sig') as file:
+        assert len(list(csv.reader(file))) == len(inactive) + 1
+
+
+def test_dry_run_counts_and_writes_nothing(bot):
+    plan = bot.dry_run(30, rps=100)
+    posts = bot.fake_group.posts[:30]
+    assert (plan.members, plan.posts) == (500, 30)
+    assert plan.likes == sum(len(post['likers']) for post in posts)
+    assert plan.inactive == 500 and not plan.inactive_known
+    assert 'groups.removeUser' not in bot.api.metrics.calls and not bot.fake_group.removed
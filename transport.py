@@ -0,0 +1,59 @@
+import asyncio
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from vkbottle.http import AiohttpClient
+
+
+class PooledHttpClient(AiohttpClient):
+    """
+    HTTP client with one long-lived connection pool for all requests of a session: keep-alive
+    connections to VK are reused instead of doing a TCP and TLS handshake again, DNS answers are cached
+    and responses are gzip-compressed if asked to.
+
+    The session is created on the first request because aiohttp needs a running loop for it,
+    and is created anew only if it was closed or the loop changed
+    """
+    def __init__(self, limit: int = 100, keepalive: float = 60., dns_ttl: int = 600, compress: bool = True,
+                 timeout: float = 60.):
+        """
+        :param limit: max amount of open connections
+        :param keepalive: seconds an idle connection is kept open
+        :param dns_ttl: seconds a DNS answer is cached
+        :param compress: ask for gzip-compressed responses
+        :param timeout: max seconds for a request
+        """
+        super().__init__()
+        self.limit = limit
+        self.keepalive = keepalive
+        self.dns_ttl = dns_ttl
+        self.compress = compress
+        self.timeout = timeout
+        self.loop = None
+
+    async def open(self) -> ClientSession:
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            connector = TCPConnector(limit=self.limit, ttl_dns_cache=self.dns_ttl, keepalive_timeout=self.keepalive)
+            self.session = ClientSession(
+                connector=connector,
+                headers={'Accept-Encoding': 'gzip, deflate' if self.compress else 'identity'},
+                timeout=ClientTimeout(total=self.timeout),
+            )
+            self.loop = loop
+        return self.session
+
+    async def request_raw(self, url: str, method: str = 'GET', data: dict = None, **kwargs):
+        await self.open()
+        return await super().request_raw(url, method, data, **kwargs)
+
+    async def request_json(self, url: str, method: str = 'GET', data: dict = None, **kwargs) -> dict:
+        await self.open()
+        return await super().request_json(url, method, data, **kwargs)
+
+    async def request_text(self, url: str, method: str = 'GET', data: dict = None, **kwargs) -> str:
+        await self.open()
+        return await super().request_text(url, method, data, **kwargs)
+
+    async def request_content(self, url: str, method: str = 'GET', data: dict = None, **kwargs) -> bytes:
+        await self.open()
+        return await super().request_content(url, method, data, **kwargs)